@@ -0,0 +1,138 @@
+"""Аутентификация по токену без запроса к базе на каждый вызов API.
+
+Пользователь по токену кешируется в ограниченном LRU процесса со сроком
+жизни, а при TOKEN_AUTH_SHARED_CACHE — ещё и в кеше Django, общем для
+процессов. Каждая запись помнит версию токена из кеша Django на момент
+чтения из базы. Выход через djoser (удаление токена), сохранение
+пользователя (смена пароля, деактивация, правка в админке) и его
+удаление увеличивают версию после фиксации транзакции, и закешированные
+записи перестают приниматься во всех процессах сразу. Поэтому кеш
+включается, только если кеш Django общий для процессов (CACHE_SHARED):
+иначе отзыв токена дошёл бы лишь до одного процесса. Изменения через
+QuerySet.update() версию не меняют и видны по истечении
+TOKEN_AUTH_CACHE_TTL.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .response_cache import bump_counter, get_counters
+
+TOKEN_VERSION_KEY = 'api:auth:token-version:{}'
+TOKEN_USER_KEY = 'api:auth:token-user:{}'
+# Поля, которые не должны попадать ни в общий кеш, ни в память процесса.
+SECRET_FIELDS = {'password'}
+
+User = get_user_model()
+
+
+class LRUCache:
+    """Потокобезопасный LRU со сроком жизни записей."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_users = None
+_users_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _users
+    with _users_lock:
+        if _users is None:
+            _users = LRUCache(
+                settings.TOKEN_AUTH_CACHE_SIZE, settings.TOKEN_AUTH_CACHE_TTL)
+        return _users
+
+
+def token_digest(key):
+    # Сам токен не попадает ни в ключи кеша, ни в память LRU.
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def cached_fields():
+    """Поля пользователя, которые хранятся в кеше.
+
+    Нередактируемые счётчики меняются запросами UPDATE без сохранения
+    пользователя, а хеш пароля не должен лежать в кеше. Без них
+    закешированный пользователь загружается с отложенными полями: пароль
+    дочитывается из базы только при проверке, а save() (например, при
+    смене пароля) записывает только загруженные поля, не затирая счётчики.
+    """
+    return tuple(
+        field.attname for field in User._meta.concrete_fields
+        if (field.editable or field.primary_key)
+        and field.attname not in SECRET_FIELDS
+    )
+
+
+def bump_token(key):
+    bump_counter(TOKEN_VERSION_KEY.format(token_digest(key)))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        if not settings.CACHE_SHARED:
+            return super().authenticate_credentials(key)
+        digest = token_digest(key)
+        # Версия читается до базы: если токен отзовут, пока идёт
+        # запрос, запись сохранится со старой версией и не подойдёт.
+        version, = get_counters([TOKEN_VERSION_KEY.format(digest)])
+        users = get_user_cache()
+        entry = users.get(digest)
+        if entry is None and settings.TOKEN_AUTH_SHARED_CACHE:
+            entry = cache.get(TOKEN_USER_KEY.format(digest))
+            if entry is not None:
+                users.set(digest, entry)
+        if entry is not None and entry[0] == version:
+            return self.build(key, *entry[1:])
+        user, token = super().authenticate_credentials(key)
+        fields = cached_fields()
+        entry = (version, user._state.db, dict(zip(
+            fields, (getattr(user, name) for name in fields))))
+        users.set(digest, entry)
+        if settings.TOKEN_AUTH_SHARED_CACHE:
+            cache.set(TOKEN_USER_KEY.format(digest), entry,
+                      settings.TOKEN_AUTH_CACHE_TTL)
+        return user, token
+
+    @staticmethod
+    def build(key, db, values):
+        # Каждому запросу свой объект: запрос может менять пользователя.
+        user = User.from_db(db, list(values), list(values.values()))
+        return user, Token(key=key, user=user)
@@ -0,0 +1,43 @@
+from recipes.images import ImageUploadError, decode_image, rendition_urls
+from rest_framework import serializers
+
+
+class Base64ImageField(serializers.FileField):
+    """Картинка в data URI на входе, адрес файла на выходе.
+
+    В отличие от drf_extra_fields.Base64ImageField, файл не собирается в
+    памяти целиком и не декодируется Pillow: проверяется только заголовок.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        try:
+            upload = decode_image(data)
+        except ImageUploadError as error:
+            raise serializers.ValidationError(str(error))
+        return super().to_internal_value(upload)
+
+
+class ImageRenditionsField(serializers.Field):
+    """Адреса уменьшенных копий картинки рецепта.
+
+    Пока копии не готовы — None, и клиент показывает оригинал.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        urls = rendition_urls(recipe)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {
+            size: {
+                extension: request.build_absolute_uri(url)
+                for extension, url in formats.items()
+            }
+            for size, formats in urls.items()
+        }
@@ -1,5 +1,6 @@
 from django_filters import rest_framework as filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Recipe, Tag
+from recipes.relations import get_relations
 
 
 class RecipeFilter(filters.FilterSet):
@@ -11,29 +12,24 @@ class RecipeFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search')
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorite_recipe__user=self.request.user)
+            return queryset.filter(id__in=get_relations(
+                self.request.user)['favorites'])
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(
-                shopping_cart_recipe__user=self.request.user)
+            return queryset.filter(id__in=get_relations(
+                self.request.user)['shopping_cart'])
         return queryset
 
-
-class IngredientInRecipe(filters.FilterSet):
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith'
-    )
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
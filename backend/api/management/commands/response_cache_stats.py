@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from api.response_cache import (GENERATIONS, get_generations, get_stats,
+                                reset_stats)
+
+
+class Command(BaseCommand):
+    help = 'Счётчики попаданий и промахов кеша анонимных ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода',
+        )
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hits"]}, промахов: {stats["misses"]}, '
+            f'доля попаданий: {ratio:.1%}'
+        )
+        for name, generation in zip(GENERATIONS, get_generations()):
+            self.stdout.write(f'Поколение {name}: {generation}')
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены'))
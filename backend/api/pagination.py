@@ -1,6 +1,158 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса без полного COUNT(*).
+
+    Оценку даёт только планировщик PostgreSQL, на остальных базах
+    выполняется обычный COUNT(*).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
 
 
 class RecipePagination(PageNumberPagination):
+    """Постраничная навигация с необязательным режимом курсора.
+
+    По умолчанию работает как PageNumberPagination. С параметром
+    cursor (в том числе пустым — первая страница) включается keyset:
+    следующая страница выбирается условием по полям cursor_ordering
+    представления, а не через OFFSET, поэтому стоит одинаково на любой
+    глубине. Общее число в этом режиме не считается, пока клиент не
+    попросит count=exact или count=estimate. Если cursor_ordering
+    представления равен None, параметр cursor не действует.
+    """
     page_size = 6
     page_size_query_param = "limit"
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_modes = ('exact', 'estimate', 'none')
+    default_cursor_ordering = ('-id',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(
+            view, 'cursor_ordering', self.default_cursor_ordering)
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            and self.ordering is not None
+        )
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.paths = [name.lstrip('-') for name in self.ordering]
+        self.fields = [
+            self.resolve(queryset.model, path) for path in self.paths]
+        self.count = self.get_count(queryset, request)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        page_size = self.get_page_size(request)
+        page = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                field.value_to_string(self.owner(page[-1], path))
+                for field, path in zip(self.fields, self.paths)
+            ]
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict((
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('results', data),
+        )))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    @staticmethod
+    def resolve(model, path):
+        """Поле по пути сортировки, в том числе через связь: rank__score."""
+        *relations, name = path.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    @staticmethod
+    def owner(obj, path):
+        """Объект, которому принадлежит последнее поле пути."""
+        for relation in path.split('__')[:-1]:
+            obj = getattr(obj, relation)
+        return obj
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, 'none')
+        if mode not in self.count_modes:
+            mode = 'none'
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    def after(self, position):
+        """Условие «строго после позиции» для составного ключа сортировки.
+
+        Для ключа (a, b) по убыванию это a < x OR (a = x AND b < y).
+        """
+        conditions = []
+        for index, (name, value) in enumerate(zip(self.ordering, position)):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = [
+                Q(**{path: previous})
+                for path, previous in zip(self.paths[:index], position)
+            ]
+            conditions.append(reduce(
+                and_, equal, Q(**{f'{name.lstrip("-")}__{lookup}': value})))
+        return reduce(or_, conditions)
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(position) != len(self.fields):
+                raise ValueError
+            return [
+                field.to_python(value)
+                for field, value in zip(self.fields, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,228 @@
+"""Замеры каждого запроса: время, запросы к базе, отрисовка ответа.
+
+PerformanceMiddleware через execute_wrapper считает запросы к базе и их
+время, запоминает самый медленный и повторы одного и того же запроса без
+учёта значений. Работа рендерера DRF (перевод готовых данных в JSON или
+CSV) замеряется отдельно как renderer, остальное время (app) — работа
+представления вместе с сериализаторами. Потоковый ответ замеряется до
+конца отдачи тела: запросы при его чтении тоже учитываются, а запись в
+журнал делается после. Итог уходит в заголовок Server-Timing и строкой
+JSON в журнал api.performance. Запрос с повторяющимся запросом к базе или со
+слишком большим их числом помечается как подозрение на N+1, долгий — как
+медленный. Процентили по представлениям копятся в памяти процесса и
+отдаются администраторам по /api/performance/.
+"""
+import json
+import logging
+import re
+import threading
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from functools import lru_cache
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUES = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SPACES = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Текст запроса без значений: по нему узнаются повторы."""
+    sql = STRING.sub('?', sql.replace('%s', '?'))
+    sql = VALUES.sub('(...)', NUMBER.sub('?', sql))
+    return SPACES.sub(' ', sql).strip()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper: число, время и тексты запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = (0.0, '')
+        self.statements = Counter()
+        self.renderer = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            if elapsed > self.slowest[0]:
+                self.slowest = (elapsed, sql)
+
+    def most_repeated(self):
+        """Самый частый запрос без учёта значений и число его повторов."""
+        repeats = Counter()
+        for sql, count in self.statements.items():
+            repeats[normalize_sql(sql)] += count
+        if not repeats:
+            return '', 0
+        return repeats.most_common(1)[0]
+
+
+class ViewStats:
+    """Последние замеры каждого представления в памяти процесса."""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = defaultdict(lambda: {
+                'requests': 0,
+                'n_plus_one': 0,
+                'slow': 0,
+                'durations': deque(maxlen=self.size),
+                'queries': deque(maxlen=self.size),
+            })
+
+    def add(self, view, duration, queries, flags):
+        with self._lock:
+            stats = self._views[view]
+            stats['requests'] += 1
+            for flag in flags:
+                stats[flag] += 1
+            stats['durations'].append(duration)
+            stats['queries'].append(queries)
+
+    def summary(self):
+        """Процентили времени (мс) и числа запросов по представлениям."""
+        with self._lock:
+            views = {
+                view: dict(stats, durations=list(stats['durations']),
+                           queries=list(stats['queries']))
+                for view, stats in self._views.items()
+            }
+        return {
+            view: {
+                'requests': stats['requests'],
+                'n_plus_one': stats['n_plus_one'],
+                'slow': stats['slow'],
+                **{
+                    f'p{round(fraction * 100)}_ms': round(
+                        percentile(stats['durations'], fraction) * 1000, 2)
+                    for fraction in (0.5, 0.95, 0.99)
+                },
+                'p95_queries': percentile(stats['queries'], 0.95),
+                'max_queries': max(stats['queries']),
+            }
+            for view, stats in sorted(views.items())
+        }
+
+
+view_stats = ViewStats(settings.PERFORMANCE_SAMPLE_SIZE)
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+
+def app_time(recorder, total):
+    """Время представления и сериализаторов без базы и рендерера."""
+    return max(total - recorder.duration - recorder.renderer, 0.0)
+
+
+class PerformanceMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = request.performance = QueryRecorder()
+        start = perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        total = perf_counter() - start
+        # Заголовки потокового ответа уходят раньше тела: в Server-Timing
+        # попадает только работа представления.
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={milliseconds(recorder.duration)};'
+            f'desc="{recorder.count} queries"',
+            f'renderer;dur={milliseconds(recorder.renderer)}',
+            f'app;dur={milliseconds(app_time(recorder, total))};'
+            f'desc="view and serializers"',
+            f'total;dur={milliseconds(total)}',
+        ))
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, response.streaming_content, recorder,
+                start)
+        else:
+            self.report(request, response, recorder, total)
+        return response
+
+    @staticmethod
+    def recording(recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def stream(self, request, response, content, recorder, start):
+        """Тело потокового ответа: запросы при его чтении тоже считаются."""
+        try:
+            with self.recording(recorder):
+                yield from content
+        finally:
+            self.report(request, response, recorder, perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # DRF отрисовывает ответ после представления: отмечаем начало и
+        # конец отрисовки.
+        started = perf_counter()
+
+        def rendered(response):
+            request.performance.renderer = perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, recorder, total):
+        match = request.resolver_match
+        view = f'{request.method} {match.view_name if match else "-"}'
+        repeated_sql, repeats = recorder.most_repeated()
+        flags = []
+        if (repeats >= settings.PERFORMANCE_REPEATED_QUERIES
+                or recorder.count >= settings.PERFORMANCE_MAX_QUERIES):
+            flags.append('n_plus_one')
+        if total * 1000 >= settings.PERFORMANCE_SLOW_REQUEST_MS:
+            flags.append('slow')
+        view_stats.add(view, total, recorder.count, flags)
+        record = {
+            'view': view,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': milliseconds(total),
+            'db_ms': milliseconds(recorder.duration),
+            'renderer_ms': milliseconds(recorder.renderer),
+            'app_ms': milliseconds(app_time(recorder, total)),
+            'queries': recorder.count,
+            'slowest_query_ms': milliseconds(recorder.slowest[0]),
+            'slowest_query': normalize_sql(recorder.slowest[1]),
+            'repeated_query': repeated_sql if repeats > 1 else '',
+            'repeats': repeats,
+            'flags': flags,
+        }
+        logger.log(
+            logging.WARNING if flags else logging.INFO,
+            json.dumps(record, ensure_ascii=False),
+        )
@@ -0,0 +1,19 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .performance import view_stats
+from .permissions import IsAdmin
+
+
+class PerformanceView(APIView):
+    """Процентили времени ответа по представлениям этого процесса."""
+
+    permission_classes = (IsAdmin,)
+
+    def get(self, request):
+        return Response(view_stats.summary())
+
+    def delete(self, request):
+        view_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
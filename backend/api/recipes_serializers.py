@@ -1,13 +1,23 @@
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, validators
-from django.shortcuts import get_object_or_404
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
+from recipes.catalog import get_catalog
+from recipes.images import schedule_renditions
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingCartTotal, Tag,
+                            read_prefetches, recipe_amounts)
 from rest_framework import serializers
+from users.models import change_counter
 
-from .users_serializers import CustomUserSerializer
+from .fields import Base64ImageField, ImageRenditionsField
+from .response_cache import payload_keys
+from .users_serializers import CustomUserSerializer, user_relations
 
 User = get_user_model()
 
@@ -56,19 +66,68 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
     )
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = (
+            'id',
+            'username',
+            'email',
+            'first_name',
+            'last_name',
+        )
+
+
+class RecipePublicSerializer(serializers.ModelSerializer):
+    """Общая для всех пользователей часть карточки рецепта."""
     tags = TagSerializer(
         many=True,
         read_only=True,
     )
-    author = CustomUserSerializer(required=False)
+    author = RecipeAuthorSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
         many=True,
-        required=False,
+        read_only=True,
     )
+    image = Base64ImageField(max_length=None)
+    image_renditions = ImageRenditionsField()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'name',
+            'image',
+            'image_renditions',
+            'text',
+            'ingredients',
+            'cooking_time'
+        )
+
+
+class RecipeReadListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return [
+            self.child.overlay(payload, recipe)
+            for recipe, payload in zip(
+                recipes, self.child.public_payloads(recipes))
+        ]
+
+
+class RecipeReadSerializer(serializers.ModelSerializer):
+    """Карточка рецепта в два слоя.
+
+    Публичная часть берётся из кеша (или собирается один раз на все
+    промахи страницы), а флаги текущего пользователя накладываются на
+    неё при каждом запросе. Поля карточки сериализует
+    RecipePublicSerializer, Meta.fields задаёт только их порядок.
+    """
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField(max_length=None)
 
     class Meta:
         model = Recipe
@@ -78,30 +137,66 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'author',
             'name',
             'image',
+            'image_renditions',
             'text',
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
             'cooking_time'
         )
-
-    def in_list(self, model, obj):
-        request = self.context['request'].user
-        if request is None or request.user.is_anonymous:
-            return False
-        return (
-            request.is_authenticated
-            and model.objects.filter(
-                user=request.user,
-                recipe=obj,
-            ).exists()
-        )
+        list_serializer_class = RecipeReadListSerializer
 
     def get_is_favorited(self, obj):
-        return self.in_list(obj, Favorite)
+        return obj.id in user_relations(self.context)['favorites']
 
     def get_is_in_shopping_cart(self, obj):
-        return self.in_list(obj, ShoppingCart)
+        return obj.id in user_relations(self.context)['shopping_cart']
+
+    def get_author_is_subscribed(self, obj):
+        return obj.author_id in user_relations(self.context)['subscriptions']
+
+    def public_payloads(self, recipes):
+        if not settings.CACHE_SHARED:
+            # Кеш процесса не узнал бы о правках в других процессах.
+            return self.build_payloads(recipes)
+        request = self.context.get('request')
+        keys = payload_keys(recipes, request.get_host() if request else '')
+        payloads = cache.get_many(keys)
+        missing = [
+            (recipe, key) for recipe, key in zip(recipes, keys)
+            if key not in payloads
+        ]
+        if missing:
+            missing_recipes, missing_keys = zip(*missing)
+            fresh = dict(zip(
+                missing_keys, self.build_payloads(missing_recipes)))
+            cache.set_many(fresh, settings.RESPONSE_CACHE_TIMEOUT)
+            payloads.update(fresh)
+        return [payloads[key] for key in keys]
+
+    def build_payloads(self, recipes):
+        prefetch_related_objects(list(recipes), *read_prefetches())
+        return [
+            RecipePublicSerializer(recipe, context=self.context).data
+            for recipe in recipes
+        ]
+
+    def overlay(self, payload, recipe):
+        flags = {
+            'author': OrderedDict(
+                payload['author'],
+                is_subscribed=self.get_author_is_subscribed(recipe),
+            ),
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+        }
+        return OrderedDict(
+            (name, flags[name] if name in flags else payload[name])
+            for name in self.Meta.fields
+        )
+
+    def to_representation(self, instance):
+        return self.overlay(self.public_payloads([instance])[0], instance)
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
@@ -109,6 +204,7 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         max_length=None,
         use_url=True,
     )
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
@@ -116,14 +212,13 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_renditions',
             'cooking_time',
         )
 
 
 class IngredientsInRecipeWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient', queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = IngredientInRecipe
@@ -133,13 +228,15 @@ class IngredientsInRecipeWriteSerializer(serializers.ModelSerializer):
         )
 
 
+def all_exist(model, ids):
+    """Проверка по базе: снимок справочника мог отстать от неё."""
+    return model.objects.filter(id__in=ids).count() == len(set(ids))
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
-    ingredients = IngredientInRecipeSerializer(many=True)
+    ingredients = IngredientsInRecipeWriteSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
 
     class Meta:
@@ -155,69 +252,124 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл картинки после сохранения уже перенесён в
+            # хранилище; закрываем его сами, как Django — файлы формы.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def validate_ingredients(self, value):
         if not value:
             raise ValidationError('Должен быть хотя бы один ингредиент!')
-        ingredients_list = []
-        for item in value:
-            ingredient = get_object_or_404(Ingredient, id=item['id'])
-            if ingredient in ingredients_list:
-                raise ValidationError('Ингредиенты должны быть уникальными!')
-            try:
-                amount = int(item['amount'])
-                if amount <= 0:
-                    raise ValidationError(
-                        'Количество ингредиента должно быть больше нуля!')
-            except ValueError:
-                raise ValidationError('Должно быть число - ошибка')
-            ingredients_list.append(ingredient)
+        ingredient_ids = [item['ingredient_id'] for item in value]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise ValidationError('Ингредиенты должны быть уникальными!')
+        if not (get_catalog().has_ingredients(ingredient_ids)
+                or all_exist(Ingredient, ingredient_ids)):
+            raise ValidationError('Ингредиент не найден!')
+        if any(item['amount'] <= 0 for item in value):
+            raise ValidationError(
+                'Количество ингредиента должно быть больше нуля!')
         return value
 
     def validate_tags(self, value):
         if not value:
             raise ValidationError('Выберите хотя бы один тег!')
-        for tag in value:
-            if tag not in Tag.objects.all():
-                raise ValidationError('Тег не найден!')
-        tags_set = set(value)
-        if len(value) != len(tags_set):
+        if len(set(value)) != len(value):
             raise ValidationError(
                 'Теги должны быть уникальными!')
+        if not (get_catalog().has_tags(value) or all_exist(Tag, value)):
+            raise ValidationError('Тег не найден!')
         return value
 
     def create_ingredients_amounts(self, ingredients, recipe):
-        IngredientInRecipe.objects.bulk_create(
-            [IngredientInRecipe(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
-                recipe=recipe,
+        if not ingredients:
+            return
+        amounts = IngredientInRecipe.objects.bulk_create_with_ids(
+            IngredientInRecipe(
+                ingredient_id=ingredient['ingredient_id'],
                 amount=ingredient['amount']
-            ) for ingredient in ingredients]
+            ) for ingredient in ingredients
         )
+        recipe.ingredients.add(*amounts)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
         recipe = Recipe.objects.create(**validated_data)
+        change_counter(User, recipe.author_id, 'recipes_count', 1)
+        schedule_renditions(recipe.id)
         recipe.tags.set(tags)
         self.create_ingredients_amounts(recipe=recipe,
                                         ingredients=ingredients)
         return recipe
 
+    def update_ingredients_amounts(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к новому списку по разнице.
+
+        Строки IngredientInRecipe создаются под каждый рецепт, поэтому
+        изменённое количество обновляется на месте, новые строки
+        добавляются, а убранные отвязываются и удаляются, если больше
+        ни к чему не привязаны. Возвращает прежние количества.
+        """
+        new_amounts = {
+            item['ingredient_id']: item['amount'] for item in ingredients}
+        rows = list(recipe.ingredients.all())
+        old_amounts = recipe_amounts(rows)
+        kept, removed = {}, []
+        for row in rows:
+            if (row.ingredient_id in new_amounts
+                    and row.ingredient_id not in kept):
+                kept[row.ingredient_id] = row
+            else:
+                removed.append(row)
+        changed = []
+        for ingredient_id, row in kept.items():
+            if row.amount != new_amounts[ingredient_id]:
+                row.amount = new_amounts[ingredient_id]
+                changed.append(row)
+        if removed:
+            recipe.ingredients.remove(*removed)
+            IngredientInRecipe.objects.filter(
+                pk__in=[row.pk for row in removed]).delete_orphans()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients_amounts(
+            recipe=recipe,
+            ingredients=[
+                item for item in ingredients
+                if item['ingredient_id'] not in kept
+            ],
+        )
+        return old_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
+        if 'image' in validated_data:
+            schedule_renditions(instance.id)
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients_amounts(recipe=instance,
-                                        ingredients=ingredients)
-        instance.save()
+        old_amounts = self.update_ingredients_amounts(
+            recipe=instance, ingredients=ingredients)
+        ShoppingCartTotal.objects.change_recipe(
+            instance,
+            old_amounts,
+            {item['ingredient_id']: item['amount'] for item in ingredients},
+        )
         return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.select_related('author').get(
+            pk=instance.pk)
         return RecipeReadSerializer(instance,
                                     context=context).data
 
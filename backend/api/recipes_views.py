@@ -1,19 +1,32 @@
-from api.filters import IngredientInRecipe, RecipeFilter
+import hashlib
+
+from api.filters import RecipeFilter
 from api.pagination import RecipePagination
 from api.permissions import IsAdminOrReadOnly
-from django.db.models import Sum
-from django.http import HttpResponse
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTextRenderer)
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
+from recipes.catalog import get_catalog
+from recipes.ingredient_index import get_ingredient_index
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            RecipeRank, ShoppingCart, ShoppingCartTotal, Tag,
+                            recipe_amounts)
+from recipes.relations import bump_relation
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
+from users.models import User, change_counter
 
 from .recipes_serializers import (IngredientSerializer, RecipeCreateSerializer,
                                   RecipeReadSerializer, ShortRecipeSerializer,
                                   TagSerializer)
+from .response_cache import cache_anonymous
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
@@ -22,22 +35,177 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        tags = get_catalog().tags
+        return Response(self.get_serializer(tags, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        tag = get_catalog().tag(lookup_id(kwargs[self.lookup_field]))
+        if tag is None:
+            raise NotFound
+        return Response(self.get_serializer(tag).data)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientInRecipe
-    search_fields = ('^name',)
+    pagination_class = None
+    autocomplete_limit = 20
+    autocomplete_max_limit = 100
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get(
+                'limit', self.autocomplete_limit))
+        except ValueError:
+            limit = self.autocomplete_limit
+        return max(1, min(limit, self.autocomplete_max_limit))
+
+    def list(self, request, *args, **kwargs):
+        catalog = get_catalog()
+        name = request.query_params.get('name', '').strip()
+        if name:
+            ingredients = catalog.search_ingredients(name, self.get_limit())
+        else:
+            ingredients = catalog.ingredients
+        return Response(self.get_serializer(ingredients, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        ingredient = get_catalog().ingredient(
+            lookup_id(kwargs[self.lookup_field]))
+        if ingredient is None:
+            raise NotFound
+        return Response(self.get_serializer(ingredient).data)
+
+
+def lookup_id(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise NotFound
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
     pagination_class = RecipePagination
     permission_classes = (IsAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    ordering_param = 'ordering'
+    search_param = 'search'
+    orderings = {
+        '-pub_date': ('-pub_date', '-id'),
+        '-favorites_count': ('-favorites_count', '-id'),
+        'popular': ('-rank__score', '-id'),
+        'relevance': ('-search_rank', '-id'),
+    }
+    default_ordering = '-pub_date'
+
+    def get_ordering(self):
+        if self.action == 'popular':
+            return 'popular'
+        params = self.request.query_params
+        value = params.get(self.ordering_param)
+        if value in self.orderings:
+            return value
+        if params.get(self.search_param, '').strip():
+            return 'relevance'
+        return self.default_ordering
+
+    @property
+    def cursor_ordering(self):
+        """Сортировка, по которой строится курсор пагинации.
+
+        Релевантность поиска и покрытие ингредиентов — вычисляемые
+        значения, а не поля, и по ним выдача листается только страницами.
+        """
+        ordering = self.get_ordering()
+        if ordering == 'relevance' or self.action == 'cook':
+            return None
+        return self.orderings[ordering]
+
+    def get_queryset(self):
+        queryset = Recipe.objects.all()
+        if self.action in ('list', 'popular'):
+            if self.get_ordering() == 'popular':
+                # Только рецепты со свежими событиями: соединение с
+                # таблицей рейтинга идёт по индексу (score, recipe).
+                queryset = queryset.filter(
+                    rank__score__gte=RecipeRank.objects.min_score(),
+                ).select_related('rank')
+        if self.action in ('list', 'retrieve', 'popular'):
+            # Теги и ингредиенты сериализатор догружает только для
+            # карточек, которых нет в кеше.
+            return queryset.select_related('author')
+        return queryset
+
+    def filter_queryset(self, queryset):
+        # Сортировка после фильтров: поиск добавляет search_rank.
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'popular'):
+            return queryset.order_by(*self.orderings[self.get_ordering()])
+        return queryset
+
+    @cache_anonymous
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False)
+    @cache_anonymous
+    def popular(self, request):
+        """Рецепты по рейтингу популярности за последние дни."""
+        return super().list(request)
+
+    def get_pantry(self):
+        """Ингредиенты из параметров ingredients и лимит max_missing."""
+        params = self.request.query_params
+        try:
+            ingredient_ids = {
+                int(value)
+                for values in params.getlist('ingredients')
+                for value in values.split(',') if value.strip()
+            }
+        except ValueError:
+            ingredient_ids = None
+        if not ingredient_ids:
+            raise ValidationError({
+                'ingredients': 'Укажите id имеющихся ингредиентов'})
+        max_missing = params.get('max_missing')
+        if max_missing in (None, ''):
+            return ingredient_ids, None
+        try:
+            max_missing = int(max_missing)
+        except ValueError:
+            max_missing = -1
+        if max_missing < 0:
+            raise ValidationError({
+                'max_missing': 'Укажите целое неотрицательное число'})
+        return ingredient_ids, max_missing
+
+    @action(detail=False)
+    def cook(self, request):
+        """Рецепты из имеющихся ингредиентов, самые полные первыми.
+
+        Подбор идёт по индексу в памяти, из базы читается только
+        страница рецептов.
+        """
+        ingredient_ids, max_missing = self.get_pantry()
+        matches = self.paginate_queryset(
+            get_ingredient_index().match(ingredient_ids, max_missing))
+        recipes = Recipe.objects.select_related('author').in_bulk(
+            [match.recipe_id for match in matches])
+        # Рецепт мог быть удалён после построения индекса.
+        matches = [match for match in matches if match.recipe_id in recipes]
+        data = self.get_serializer(
+            [recipes[match.recipe_id] for match in matches], many=True).data
+        for item, match in zip(data, matches):
+            item['coverage'] = round(match.matched / match.total, 3)
+            item['missing'] = match.total - match.matched
+        return self.get_paginated_response(data)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -47,34 +215,56 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-    def _do_post_method(self, request, model, error_data):
+    def perform_destroy(self, instance):
+        with transaction.atomic(savepoint=False):
+            amounts = list(instance.ingredients.all())
+            ShoppingCartTotal.objects.change_recipe(
+                instance, recipe_amounts(amounts), {})
+            instance.delete()
+            change_counter(User, instance.author_id, 'recipes_count', -1)
+            IngredientInRecipe.objects.filter(
+                pk__in=[amount.pk for amount in amounts]).delete_orphans()
+
+    @staticmethod
+    def _change_relation(write, user, recipe, on_change=None):
+        """Меняет связь одним запросом, а вместе с on_change — в транзакции."""
+        if not on_change:
+            return write()
+        with transaction.atomic(savepoint=False):
+            changed = write()
+            if changed:
+                on_change(user, recipe)
+        return changed
+
+    def _do_post_method(self, request, model, relation, error_data,
+                        on_change=None):
         user = request.user
         recipe = self.get_object()
-        if model.objects.filter(
-                user=user,
-                recipe=recipe,
-        ).exists():
-            return Response(error_data, status=status.HTTP_400_BAD_REQUEST)
-        model.objects.create(
-            user=user,
-            recipe=recipe,
+        created = self._change_relation(
+            lambda: model.objects.create_if_missing(user=user, recipe=recipe),
+            user, recipe, on_change,
         )
+        bump_relation(user.id, relation)
+        if not created:
+            return Response(error_data, status=status.HTTP_400_BAD_REQUEST)
         serializer = ShortRecipeSerializer(
             recipe,
             context={"request": request},
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def _do_delete_method(self, request, model, error_data):
+    def _do_delete_method(self, request, model, relation, error_data,
+                          on_change=None):
         user = request.user
-        recipe = self.get_object()
-        favorite = model.objects.filter(
-            user=user,
-            recipe=recipe,
+        recipe = Recipe(id=lookup_id(self.kwargs[self.lookup_field]))
+        deleted = self._change_relation(
+            lambda: model.objects.delete_if_present(user=user, recipe=recipe),
+            user, recipe, on_change,
         )
-        if favorite.exists():
-            favorite.delete()
+        bump_relation(user.id, relation)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        self.get_object()
         return Response(error_data, status=status.HTTP_400_BAD_REQUEST)
 
     @action(
@@ -86,9 +276,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         model = Favorite
         if request.method == 'POST':
             error_data = {'errors': 'Рецепт добавлен в избранное'}
-            return self._do_post_method(request, model, error_data)
+            return self._do_post_method(
+                request, model, 'favorites', error_data)
         error_data = {'errors': 'Рецепт удален из избранного'}
-        return self._do_delete_method(request, model, error_data)
+        return self._do_delete_method(
+            request, model, 'favorites', error_data)
 
     @action(
         detail=True,
@@ -99,46 +291,47 @@ class RecipeViewSet(viewsets.ModelViewSet):
         model = ShoppingCart
         if request.method == 'POST':
             error_data = {'errors': 'Рецепт уже добавлен в корзину'}
-            return self._do_post_method(request, model, error_data)
+            return self._do_post_method(
+                request, model, 'shopping_cart', error_data,
+                on_change=ShoppingCartTotal.objects.add_recipe)
         error_data = {'errors': 'Рецепт уже удален из корзины'}
-        return self._do_delete_method(request, model, error_data)
+        return self._do_delete_method(
+            request, model, 'shopping_cart', error_data,
+            on_change=ShoppingCartTotal.objects.remove_recipe)
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated],
+        renderer_classes=(
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredient_queryset = IngredientInRecipe.objects.filter(
-            recipes__shoppingcart__user=user
-        ).values(
+        totals = ShoppingCartTotal.objects.filter(user=request.user)
+        renderer = request.accepted_renderer
+        # Отпечаток по самим строкам итогов: суммы и счётчики не меняются,
+        # когда количества переходят от одного ингредиента к другому.
+        fingerprint = hashlib.md5()
+        for ingredient_id, amount in totals.values_list(
+                'ingredient_id', 'amount').order_by('ingredient_id'):
+            fingerprint.update(f'{ingredient_id}:{amount};'.encode())
+        etag = quote_etag(f'{renderer.format}-{fingerprint.hexdigest()}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        rows = totals.values_list(
             'ingredient__name',
             'ingredient__measurement_unit',
-        ).annotate(
-            ingredient_sum=Sum('amount')
-        ).values_list(
-            'ingredient__name',
-            'ingredient_sum',
-            'ingredient__measurement_unit',
-        )
-        shopping_cart = {}
-        for item in ingredient_queryset:
-            name = item[0]
-            if name not in shopping_cart:
-                shopping_cart[name] = {
-                    'amount': item[1],
-                    'measurement_unit': item[2],
-                }
-        filename = 'hopping_list.txt'
-        shopping_cart_text = 'Список покупок: '
-        for list_number, (name, data) in enumerate(shopping_cart.items(), 1):
-            shopping_cart_text += (
-                f'{list_number}. {name} - {data["amount"]} '
-                f'{data["measurement_unit"]}'
-            )
-        response = HttpResponse(
-            shopping_cart_text, content_type='text.txt; charset=utf-8'
+            'amount',
+        ).order_by('ingredient__name').iterator()
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f'{renderer.media_type}; charset=utf-8',
         )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_list.{renderer.format}')
         return response
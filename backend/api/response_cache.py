@@ -0,0 +1,153 @@
+"""Кеш ответов API рецептов.
+
+Анонимный ответ зависит только от пути и параметров запроса, поэтому
+данные ответа кешируются в кеше Django по нормализованной строке запроса.
+Для остальных пользователей кешируется публичная часть карточки каждого
+рецепта, а флаги пользователя накладываются при каждом запросе.
+В ключи входят счётчики версий моделей, из которых собраны данные:
+сигналы увеличивают счётчик после фиксации транзакции, и старые записи
+перестают находиться, а потом вытесняются по таймауту. Счётчики
+должны быть видны всем процессам, поэтому без общего кеша
+(CACHE_SHARED=False) ответы и карточки не кешируются.
+"""
+import hashlib
+from functools import wraps
+from time import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+GENERATIONS = ('recipe', 'tag', 'ingredient', 'user')
+GENERATION_KEY = 'api:response-cache:generation:{}'
+RECIPE_VERSION_KEY = 'api:response-cache:recipe:{}'
+AUTHOR_VERSION_KEY = 'api:response-cache:author:{}'
+HITS_KEY = 'api:response-cache:hits'
+MISSES_KEY = 'api:response-cache:misses'
+RESPONSE_KEY = 'api:response-cache:response:{}'
+PAYLOAD_KEY = 'api:response-cache:payload:{}'
+
+
+def counter_start():
+    # Счётчик, вытесненный из кеша, начинается с нового значения,
+    # чтобы не совпасть с версией уже лежащих в кеше записей.
+    return int(time() * 1000)
+
+
+def incr(key, start=0):
+    """Атомарное увеличение счётчика с созданием при первом обращении."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, start, None)
+        return cache.incr(key)
+
+
+def get_counters(keys):
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        start = counter_start()
+        for key in missing:
+            cache.add(key, start, None)
+        values.update(cache.get_many(missing))
+    return [values.get(key) for key in keys]
+
+
+def get_generations():
+    return get_counters([GENERATION_KEY.format(name) for name in GENERATIONS])
+
+
+def bump_counter(key):
+    """Делает устаревшими закешированные данные после фиксации."""
+    transaction.on_commit(lambda: incr(key, counter_start()))
+
+
+def bump_generation(name):
+    bump_counter(GENERATION_KEY.format(name))
+
+
+def bump_recipe(recipe_id):
+    bump_counter(RECIPE_VERSION_KEY.format(recipe_id))
+
+
+def bump_author(author_id):
+    bump_counter(AUTHOR_VERSION_KEY.format(author_id))
+
+
+def payload_keys(recipes, host):
+    """Ключи публичных карточек рецептов.
+
+    Карточка меняется вместе с рецептом, его автором и справочниками
+    тегов и ингредиентов, поэтому в ключ входят их версии. Все версии
+    читаются одним обращением к кешу.
+    """
+    recipe_keys = [RECIPE_VERSION_KEY.format(item.id) for item in recipes]
+    author_keys = [
+        AUTHOR_VERSION_KEY.format(item.author_id) for item in recipes]
+    shared_keys = [
+        GENERATION_KEY.format(name) for name in ('tag', 'ingredient')]
+    keys = recipe_keys + author_keys + shared_keys
+    versions = dict(zip(keys, get_counters(keys)))
+    shared = ':'.join(str(versions[key]) for key in shared_keys)
+    return [
+        PAYLOAD_KEY.format(hashlib.md5(
+            f'{host}:{recipe.id}:{versions[recipe_key]}:'
+            f'{versions[author_key]}:{shared}'.encode()
+        ).hexdigest())
+        for recipe, recipe_key, author_key in zip(
+            recipes, recipe_keys, author_keys)
+    ]
+
+
+def get_stats():
+    values = cache.get_many((HITS_KEY, MISSES_KEY))
+    return {
+        'hits': values.get(HITS_KEY, 0),
+        'misses': values.get(MISSES_KEY, 0),
+    }
+
+
+def reset_stats():
+    cache.delete_many((HITS_KEY, MISSES_KEY))
+
+
+def response_key(request):
+    params = request.query_params
+    query = urlencode(sorted(
+        (name, value)
+        for name in params
+        for value in params.getlist(name)
+    ))
+    generations = ':'.join(str(value) for value in get_generations())
+    raw = f'{request.get_host()}{request.path}?{query}#{generations}'
+    return RESPONSE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def cache_anonymous(method):
+    """Кеширует успешные ответы действия представления для анонимов.
+
+    Хранятся данные ответа, а не готовые байты, поэтому выбор
+    рендерера остаётся за DRF. Заголовок X-Cache показывает HIT/MISS.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.is_authenticated or not settings.CACHE_SHARED:
+            return method(self, request, *args, **kwargs)
+        key = response_key(request)
+        data = cache.get(key)
+        if data is not None:
+            incr(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        incr(MISSES_KEY)
+        response = method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
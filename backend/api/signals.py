@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from rest_framework.authtoken.models import Token
+
+from .authentication import bump_token
+from .response_cache import bump_author, bump_generation, bump_recipe
+
+User = get_user_model()
+
+PUBLIC_USER_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    # Теги и ингредиенты рецепта меняются только вместе с сохранением
+    # самого рецепта, поэтому m2m_changed не слушается: приёмник на
+    # промежуточной модели отключил бы быстрое удаление её строк.
+    bump_generation('recipe')
+    bump_recipe(instance.id)
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def invalidate_recipe_amount(sender, instance, created, **kwargs):
+    bump_generation('recipe')
+    # Правка отдельной строки (например, из админки) меняет карточки
+    # рецептов, в которые она входит. Новые строки API сопровождает
+    # сохранением рецепта.
+    if not created:
+        for recipe_id in instance.recipes.values_list('id', flat=True):
+            bump_recipe(recipe_id)
+
+
+@receiver(pre_delete, sender=IngredientInRecipe)
+def collect_amount_recipes(sender, instance, **kwargs):
+    # После удаления строки её связи с рецептами уже не найти.
+    instance._deleted_from_recipes = list(
+        instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def invalidate_deleted_amount(sender, instance, **kwargs):
+    bump_generation('recipe')
+    for recipe_id in getattr(instance, '_deleted_from_recipes', ()):
+        bump_recipe(recipe_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_generation('tag')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_generation('ingredient')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login, в ответах его нет.
+    if update_fields and not PUBLIC_USER_FIELDS & set(update_fields):
+        return
+    bump_generation('user')
+    bump_author(instance.id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_token(sender, instance, created=False,
+                          update_fields=None, **kwargs):
+    # Смена пароля, деактивация и правка профиля должны сразу дойти до
+    # аутентификации; вход меняет только last_login.
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True):
+        bump_token(key)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    # Выход через djoser и удаление пользователя удаляют его токен.
+    bump_token(instance.key)
@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .performance_views import PerformanceView
 from .recipes_views import IngredientViewSet, RecipeViewSet, TagViewSet
 from .users_views import CustomUserViewSet
 
@@ -11,6 +12,7 @@ router.register("recipes", RecipeViewSet, basename="recipes")
 router.register("ingredients", IngredientViewSet, basename="ingredients")
 
 urlpatterns = [
+    path('performance/', PerformanceView.as_view()),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
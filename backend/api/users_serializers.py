@@ -1,9 +1,23 @@
+from django.contrib.auth.models import AnonymousUser
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from users.models import User, Subscription
 from recipes.models import Recipe
+from recipes.relations import get_relations
 from rest_framework.validators import UniqueTogetherValidator
 
+from .fields import ImageRenditionsField
+
+
+def user_relations(context):
+    """Множества id пользователя запроса, одни на весь ответ."""
+    relations = context.get('relations')
+    if relations is None:
+        request = context.get('request')
+        user = request.user if request else AnonymousUser()
+        relations = context['relations'] = get_relations(user)
+    return relations
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
 
@@ -37,33 +51,9 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return request.user.follower.filter(author=obj).exists()
-
-
-    is_subscribed = serializers.SerializerMethodField()
-
-    class Meta:
-        model = User
-        fields = (
-            'email',
-            'id',
-            'username',
-            'first_name',
-            'last_name',
-            'is_subscribed',
-        )
-
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        if not request or user.is_anonymous:
-            return False
-        subcribe = user.follower.filter(author=obj)
-        return subcribe.exists()
-
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in user_relations(self.context)['subscriptions']
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -85,9 +75,11 @@ class FollowSerializer(serializers.ModelSerializer):
 
 
 class FollowRecipeSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         ordering = ('id',)
 
 
@@ -96,9 +88,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         source='get_is_subscribed'
     )
     recipes = serializers.SerializerMethodField(source='get_recipes')
-    recipes_count = serializers.SerializerMethodField(
-        source='get_recipes_count'
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -114,25 +104,17 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return request.user.follower.filter(author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in user_relations(self.context)['subscriptions']
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        if not recipes_limit:
-            return FollowRecipeSerializer(
-                Recipe.objects.filter(author=obj),
-                many=True,
-                context={'request': request}
-            ).data
+        if hasattr(obj, 'recipes_page'):
+            recipes = obj.recipes_page
+        else:
+            recipes = obj.recipes.all()[:self.context.get('recipes_limit')]
         return FollowRecipeSerializer(
-            Recipe.objects.filter(author=obj)[:int(recipes_limit)],
+            recipes,
             many=True,
-            context={'request': request}
+            context=self.context,
         ).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
@@ -1,91 +1,108 @@
+from collections import defaultdict
+
 from api.pagination import RecipePagination
-from django.shortcuts import get_object_or_404
+from django.db.models import BooleanField, Value
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from users.models import Subscription, User
 from recipes.models import Recipe
+from recipes.relations import bump_relation
 
-from .users_serializers import FollowRecipeSerializer, SubscriptionSerializer
-from .recipes_serializers import RecipeReadSerializer
+from .recipes_views import lookup_id
+from .users_serializers import SubscriptionSerializer
 
 
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all().order_by('id')
     pagination_class = RecipePagination
+    cursor_ordering = ('id',)
     search_fields = ('username',)
 
+    def get_recipes_limit(self):
+        value = self.request.query_params.get('recipes_limit')
+        if not value:
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError({
+                'recipes_limit': 'Укажите целое положительное число'})
+        return limit
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('subscribe', 'subscriptions'):
+            context['recipes_limit'] = self.get_recipes_limit()
+        return context
+
+    @staticmethod
+    def prefetch_recipes(authors, limit):
+        """Загружает рецепты всех авторов страницы одним запросом."""
+        recipes = Recipe.objects.filter(author__in=authors)
+        if limit:
+            recipes = recipes.top_per_author(limit)
+        by_author = defaultdict(list)
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipes_page = by_author[author.id]
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def subscriptions(self, request):
+        authors = User.objects.filter(
+            subscribed_authors__user=request.user,
+        ).annotate(
+            is_subscribed=Value(True, BooleanField()),
+        ).order_by('id')
+        page = self.paginate_queryset(authors)
+        context = self.get_serializer_context()
+        self.prefetch_recipes(page, context['recipes_limit'])
+        serializer = SubscriptionSerializer(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
+
     @action(
-        methods=['post', 'delete'],
+        methods=('post', 'delete'),
         detail=True,
-        permission_classes=[IsAuthenticated],
+        permission_classes=(IsAuthenticated,),
     )
     def subscribe(self, request, id=None):
+        user = request.user
         if request.method == 'POST':
-            user = request.user
             author = self.get_object()
             if user == author:
                 data = {'errors': 'Ошибка: подписка на себя'}
                 return Response(data, status=status.HTTP_400_BAD_REQUEST)
-            if Subscription.objects.filter(
+            created = Subscription.objects.create_if_missing(
                 user=user,
                 author=author,
-            ).exists():
+            )
+            bump_relation(user.id, 'subscriptions')
+            if not created:
                 data = {'errors': 'Вы подписаны на данного пользователя'}
                 return Response(data, status=status.HTTP_400_BAD_REQUEST)
-            Subscription.objects.create(
-                user=user,
-                author=author,
-            )
+            author.is_subscribed = True
             serializer = SubscriptionSerializer(
                 author,
-                context={'request': request},
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            user = request.user
-            author = self.get_object()
-            subscription = Subscription.objects.filter(
-                user=user,
-                author=author,
-            )
-            if subscription.exists():
-                subscription.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            data = {'errors': 'Вы не подписаны на данного пользователя'}
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-    @action(
-        methods=('post', 'delete'),
-        url_path='subscribe',
-        detail=True,
-        permission_classes=(IsAuthenticated,),
-    )
-    def subscribe(self, request, id):
-        user = request.user
-        author = get_object_or_404(User, id=id)
-        if request.method == 'POST':
-            data = {'user': user.id, 'author': id}
-            serializer = FollowRecipeSerializer(
-                data=data,
-                context={'request': request}
+                context=self.get_serializer_context(),
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        following = get_object_or_404(Subscription, user=user, author=author)
-        following.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
-    
-    @action(methods=('GET'),
-        url_path='subscribe2',
-        detail=True,
-        permission_classes=(IsAuthenticated,),
-    )
-    def subscribe(self, request, id):
-        author = get_object_or_404(User, id=id)
-        posts=Recipe.objects.filter(author=author)
-        data = RecipeReadSerializer(posts, many=True)
-        return Response(data.data)
+        author = User(id=lookup_id(id))
+        deleted = Subscription.objects.delete_if_present(
+            user=user,
+            author=author,
+        )
+        bump_relation(user.id, 'subscriptions')
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        self.get_object()
+        data = {'errors': 'Вы не подписаны на данного пользователя'}
+        return Response(data, status=status.HTTP_400_BAD_REQUEST)
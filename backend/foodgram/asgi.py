@@ -0,0 +1,111 @@
+"""Точка входа ASGI.
+
+Django 2.2 не умеет ASGI, поэтому приложение WSGI запускается в
+ограниченном пуле потоков (ASGI_THREADS), а цикл событий сервера
+принимает соединения и дочитывает тело запроса: медленный клиент с
+большой загрузкой держит только сокет, а не поток. Ответ поток отдаёт
+сам, ожидая, пока сервер примет каждый кусок, поэтому клиент, медленно
+скачивающий большой или потоковый ответ, держит поток (а при чтении
+строк из базы по ходу отдачи — и его соединение) до конца скачивания.
+Представления остаются синхронными: каждое занимает поток пула на время
+своей работы, и пул же ограничивает число соединений с базой.
+
+asgiref.wsgi.WsgiToAsgi для этого не годится: он выполняет все запросы
+в одном потоке (sync_to_async с thread_sensitive) и не закрывает ответ,
+поэтому Django не отправляет request_finished и не закрывает соединения
+с базой.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from asgiref.wsgi import WsgiToAsgiInstance
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
+
+# Тело запроса до этого размера держится в памяти, дальше — на диске.
+BODY_MEMORY_LIMIT = 64 * 1024
+
+
+class ThreadPoolInstance(WsgiToAsgiInstance):
+    """Один запрос HTTP: окружение WSGI и start_response от asgiref."""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        self.scope = scope
+        loop = asyncio.get_event_loop()
+
+        def sync_send(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        self.sync_send = sync_send
+        with SpooledTemporaryFile(max_size=BODY_MEMORY_LIMIT) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            await loop.run_in_executor(self.executor, self.run, body)
+
+    def run(self, body):
+        environ = self.build_environ(self.scope, body)
+        response = self.wsgi_application(environ, self.start_response)
+        try:
+            for chunk in response:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if chunk:
+                    self.sync_send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+        finally:
+            # HttpResponse.close() отправляет request_finished.
+            if hasattr(response, 'close'):
+                response.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+
+class ThreadPoolApplication:
+
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Протокол {scope["type"]} не поддерживается')
+        return await ThreadPoolInstance(
+            self.wsgi_application, self.executor)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Дожидаемся запросов, уже выполняющихся в пуле.
+                await asyncio.get_event_loop().run_in_executor(
+                    None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = ThreadPoolApplication(
+    get_wsgi_application(), int(os.getenv('ASGI_THREADS', 16)))
@@ -10,7 +10,7 @@ SECRET_KEY = 'p&l%385148kslhtyn^##a1)ilz@4zqj=rq&agdol^##zgl9(vs'
 
 DEBUG = True
 
-ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS')
+ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost').split(',')
 
 
 INSTALLED_APPS = [
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.performance.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -82,6 +83,66 @@ else:
     }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Кеш виден всем процессам сервера. Кеш в памяти процесса годится для
+# этого, только если процесс один (CACHE_SINGLE_PROCESS=True, например
+# manage.py runserver); иначе кеши, которые сбрасываются через него,
+# отключаются.
+CACHE_SHARED = (
+    CACHES['default']['BACKEND'] not in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache',
+    )
+    or os.getenv('CACHE_SINGLE_PROCESS', 'False') == 'True'
+)
+# Без общего кеша справочник и индекс ингредиентов в памяти процесса
+# перестраиваются не реже, чем раз в столько секунд.
+LOCAL_SNAPSHOT_TIMEOUT = int(os.getenv('LOCAL_SNAPSHOT_TIMEOUT', 10))
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+USER_RELATIONS_CACHE_TIMEOUT = int(
+    os.getenv('USER_RELATIONS_CACHE_TIMEOUT', 3600))
+RECIPE_RANK_HALF_LIFE_DAYS = float(
+    os.getenv('RECIPE_RANK_HALF_LIFE_DAYS', 7))
+RECIPE_RANK_WINDOW_DAYS = float(os.getenv('RECIPE_RANK_WINDOW_DAYS', 30))
+# Уменьшенные копии картинок рецептов: размер -> длинная сторона.
+RECIPE_IMAGE_RENDITIONS = {'thumb': 160, 'card': 480}
+RECIPE_IMAGE_QUALITY = int(os.getenv('RECIPE_IMAGE_QUALITY', 80))
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+TOKEN_AUTH_CACHE_SIZE = int(os.getenv('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.getenv('TOKEN_AUTH_CACHE_TTL', 300))
+TOKEN_AUTH_SHARED_CACHE = os.getenv(
+    'TOKEN_AUTH_SHARED_CACHE', 'False') == 'True'
+PERFORMANCE_REPEATED_QUERIES = int(
+    os.getenv('PERFORMANCE_REPEATED_QUERIES', 5))
+PERFORMANCE_MAX_QUERIES = int(os.getenv('PERFORMANCE_MAX_QUERIES', 30))
+PERFORMANCE_SLOW_REQUEST_MS = int(
+    os.getenv('PERFORMANCE_SLOW_REQUEST_MS', 500))
+PERFORMANCE_SAMPLE_SIZE = int(os.getenv('PERFORMANCE_SAMPLE_SIZE', 1000))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERFORMANCE_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -122,7 +183,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.LimitOffsetPagination',
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     RecipeRank, ShoppingCart, Tag)
 
 
 @admin.register(Tag)
@@ -42,7 +42,8 @@ class RecipeAdmin(admin.ModelAdmin):
         'text',
         'cooking_time',
         'pub_date',
-        'count_favorite'
+        'favorites_count',
+        'in_carts_count',
     )
     list_filter = (
         "author",
@@ -51,8 +52,14 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     search_fields = ('author__username', 'name',)
 
-    def count_favorite(self, obj):
-        return obj.favorite_recipe.count()
+
+@admin.register(RecipeRank)
+class RecipeRankAdmin(admin.ModelAdmin):
+    list_display = (
+        'recipe',
+        'score',
+    )
+    ordering = ('-score',)
 
 
 @admin.register(Favorite)
@@ -0,0 +1,127 @@
+"""Справочник ингредиентов и тегов в памяти процесса.
+
+Снимок неизменяем и строится одним запросом на каждую модель. Его версия
+хранится в кеше Django: сигналы post_save/post_delete и импорт
+ингредиентов меняют версию, и каждый процесс перечитывает снимок при
+следующем обращении. Без общего кеша (CACHE_SHARED=False) о правках в
+других процессах не узнать, и снимок живёт не дольше
+LOCAL_SNAPSHOT_TIMEOUT секунд.
+"""
+import threading
+import uuid
+from bisect import bisect_left
+from collections import namedtuple
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = 'recipes:catalog:version'
+
+IngredientEntry = namedtuple(
+    'IngredientEntry', ('id', 'name', 'measurement_unit'))
+TagEntry = namedtuple('TagEntry', ('id', 'name', 'color', 'slug'))
+
+
+class Catalog:
+
+    def __init__(self, version, ingredients, tags):
+        self.version = version
+        self.ingredients = tuple(sorted(
+            ingredients, key=lambda entry: entry.name))
+        self.tags = tuple(sorted(tags, key=lambda entry: entry.name))
+        self._lower_names = tuple(
+            entry.name.lower() for entry in self.ingredients)
+        self._prefix_order = tuple(sorted(
+            range(len(self.ingredients)),
+            key=lambda index: self._lower_names[index],
+        ))
+        self._prefix_keys = tuple(
+            self._lower_names[index] for index in self._prefix_order)
+        self._ingredients_by_id = {
+            entry.id: entry for entry in self.ingredients}
+        self._tags_by_id = {entry.id: entry for entry in self.tags}
+
+    def ingredient(self, ingredient_id):
+        return self._ingredients_by_id.get(ingredient_id)
+
+    def tag(self, tag_id):
+        return self._tags_by_id.get(tag_id)
+
+    def has_ingredients(self, ingredient_ids):
+        return self._ingredients_by_id.keys() >= set(ingredient_ids)
+
+    def has_tags(self, tag_ids):
+        return self._tags_by_id.keys() >= set(tag_ids)
+
+    def search_ingredients(self, query, limit):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        query = query.strip().lower()
+        start = bisect_left(self._prefix_keys, query)
+        prefixed = []
+        for position in range(start, len(self._prefix_keys)):
+            if not self._prefix_keys[position].startswith(query):
+                break
+            prefixed.append(self._prefix_order[position])
+        prefixed.sort()
+        result = [self.ingredients[index] for index in prefixed[:limit]]
+        if len(result) < limit:
+            seen = set(prefixed)
+            for index, name in enumerate(self._lower_names):
+                if query in name and index not in seen:
+                    result.append(self.ingredients[index])
+                    if len(result) == limit:
+                        break
+        return result
+
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def load_catalog(version):
+    from recipes.models import Ingredient, Tag
+    return Catalog(
+        version,
+        (IngredientEntry(*row) for row in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit')),
+        (TagEntry(*row) for row in Tag.objects.values_list(
+            'id', 'name', 'color', 'slug')),
+    )
+
+
+def snapshot_version(key):
+    """Версия снимка из общего кеша или номер отрезка его жизни."""
+    if not settings.CACHE_SHARED:
+        return int(monotonic() // settings.LOCAL_SNAPSHOT_TIMEOUT)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_catalog():
+    global _catalog
+    version = snapshot_version(CATALOG_VERSION_KEY)
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _lock:
+        if _catalog is None or _catalog.version != version:
+            _catalog = load_catalog(version)
+        return _catalog
+
+
+def bump_catalog_version():
+    """Помечает снимки устаревшими после фиксации текущей транзакции."""
+    transaction.on_commit(reset_catalog)
+
+
+def reset_catalog():
+    global _catalog
+    with _lock:
+        _catalog = None
+    if settings.CACHE_SHARED:
+        cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,47 @@
+"""Денормализованные счётчики рецептов и пользователей.
+
+Счётчики меняются запросом UPDATE с F() там же, где создаются и
+удаляются строки, которые они считают. Правки в обход API (админка,
+каскадное удаление пользователя) счётчики не трогают; их сверяет и
+исправляет команда rebuild_counters.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Recipe
+from users.models import User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', 'favorites'),
+    (Recipe, 'in_carts_count', 'shoppingcart'),
+    (User, 'recipes_count', 'recipes'),
+    (User, 'followers_count', 'subscribed_authors'),
+)
+
+
+def stale_counters():
+    """Расхождения: [(модель, поле, {pk: верное значение})]."""
+    stale = []
+    for model, field, relation in COUNTERS:
+        actual = dict(
+            model.objects.annotate(actual=Count(relation)).exclude(
+                **{field: F('actual')}
+            ).order_by().values_list('pk', 'actual')
+        )
+        if actual:
+            stale.append((model, field, actual))
+    return stale
+
+
+def rebuild_counters():
+    """Исправляет расхождения и возвращает число исправленных строк."""
+    fixed = 0
+    with transaction.atomic():
+        for model, field, actual in stale_counters():
+            model.objects.bulk_update(
+                [model(pk=pk, **{field: value})
+                 for pk, value in actual.items()],
+                (field,),
+            )
+            fixed += len(actual)
+    return fixed
@@ -0,0 +1,183 @@
+"""Загрузка картинок рецептов и их уменьшенные копии.
+
+Картинка из data URI раскодируется по частям во временный файл, а
+проверяется только заголовок: формат и размеры. Уменьшенные копии
+(превью и картинка карточки в WebP и JPEG) строятся вне запроса —
+пулом потоков после фиксации транзакции или командой
+generate_image_renditions. В рецепте хранится имя картинки, для которой
+копии готовы: пока оно не совпадает с текущей картинкой, клиенты
+получают только оригинал.
+"""
+import base64
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+RENDITION_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+RENDITIONS_DIR = 'recipes/renditions/'
+# Кратно четырём: каждая часть раскодируется независимо.
+DECODE_CHUNK = 64 * 1024 * 4
+
+
+class ImageUploadError(ValueError):
+    pass
+
+
+def decode_image(data_uri):
+    """Раскодирует data URI во временный файл и проверяет заголовок.
+
+    Пиксели не читаются: Pillow разбирает только заголовок, чтобы узнать
+    формат и размеры. Возвращает TemporaryUploadedFile.
+    """
+    header, separator, encoded = data_uri.partition(';base64,')
+    if not header.startswith('data:image/') or not separator:
+        raise ImageUploadError('Ожидается картинка в формате data URI.')
+    upload = TemporaryUploadedFile(
+        'upload', header[len('data:'):], 0, None)
+    try:
+        for start in range(0, len(encoded), DECODE_CHUNK):
+            upload.write(base64.b64decode(
+                encoded[start:start + DECODE_CHUNK], validate=True))
+        upload.size = upload.tell()
+        upload.seek(0)
+        with Image.open(upload) as image:
+            image_format, (width, height) = image.format, image.size
+    except (ValueError, OSError, Image.DecompressionBombError):
+        upload.close()
+        raise ImageUploadError('Файл не является картинкой.')
+    if (image_format not in IMAGE_FORMATS
+            or width * height > settings.RECIPE_IMAGE_MAX_PIXELS):
+        upload.close()
+        raise ImageUploadError(
+            'Поддерживаются JPEG, PNG, GIF и WebP не больше '
+            f'{settings.RECIPE_IMAGE_MAX_PIXELS} пикселей.')
+    upload.seek(0)
+    upload.name = f'{uuid.uuid4().hex}.{IMAGE_FORMATS[image_format]}'
+    return upload
+
+
+def rendition_name(image_name, size, extension):
+    """Имя копии: от имени картинки, длины стороны и качества.
+
+    Картинки хранятся под хешем содержимого, поэтому одинаковые
+    картинки делят копии, а при смене настроек копии получают новые
+    имена и их можно кешировать бессрочно.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    side = settings.RECIPE_IMAGE_RENDITIONS[size]
+    quality = settings.RECIPE_IMAGE_QUALITY
+    return f'{RENDITIONS_DIR}{stem}-{side}-q{quality}.{extension}'
+
+
+def rendition_urls(recipe):
+    """Адреса уменьшенных копий по размерам и форматам или None."""
+    if not recipe.image or recipe.rendered_image != recipe.image.name:
+        return None
+    return {
+        size: {
+            extension: default_storage.url(
+                rendition_name(recipe.image.name, size, extension))
+            for extension in RENDITION_FORMATS
+        }
+        for size in settings.RECIPE_IMAGE_RENDITIONS
+    }
+
+
+def flatten(image):
+    """RGB без прозрачности: JPEG её не поддерживает."""
+    if image.mode == 'RGB':
+        return image
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_renditions(recipe, force=False):
+    """Строит копии картинки рецепта и отмечает их готовность.
+
+    Уже существующие копии (той же картинки у другого рецепта) не
+    перестраиваются, если не указан force.
+    """
+    name = recipe.image.name
+    missing = [
+        (size, side)
+        for size, side in settings.RECIPE_IMAGE_RENDITIONS.items()
+        if force or not all(
+            default_storage.exists(rendition_name(name, size, extension))
+            for extension in RENDITION_FORMATS
+        )
+    ]
+    if missing:
+        largest = max(side for _, side in missing)
+        with recipe.image.open('rb') as source, Image.open(source) as image:
+            # Для JPEG декодер сразу уменьшает картинку кратно степени
+            # двойки.
+            image.draft('RGB', (largest, largest))
+            image.load()
+            original = flatten(image)
+    for size, side in missing:
+        copy = original.copy()
+        copy.thumbnail((side, side), Image.Resampling.LANCZOS)
+        for extension, image_format in RENDITION_FORMATS.items():
+            buffer = BytesIO()
+            copy.save(buffer, image_format,
+                      quality=settings.RECIPE_IMAGE_QUALITY)
+            path = rendition_name(name, size, extension)
+            default_storage.delete(path)
+            default_storage.save(path, ContentFile(buffer.getvalue()))
+    recipe.rendered_image = name
+    recipe.save(update_fields=('rendered_image',))
+
+
+def render_recipe(recipe_id):
+    from recipes.models import Recipe
+    close_old_connections()
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is not None and recipe.rendered_image != recipe.image.name:
+            render_renditions(recipe)
+    except Exception:
+        logger.exception('Не удалось построить копии картинки рецепта %s',
+                         recipe_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def schedule_renditions(recipe_id):
+    """Ставит построение копий в пул после фиксации транзакции.
+
+    При RECIPE_IMAGE_WORKERS = 0 копии строит только команда
+    generate_image_renditions.
+    """
+    if settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(render_recipe, recipe_id))
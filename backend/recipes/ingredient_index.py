@@ -0,0 +1,103 @@
+"""Обратный индекс «ингредиент → рецепты» в памяти процесса.
+
+Индекс строится одним запросом по связям рецептов с ингредиентами и
+отвечает на вопрос «что приготовить из того, что есть» без соединения
+трёх таблиц на каждый запрос: обходятся только списки рецептов
+переданных ингредиентов. Версия индекса хранится в кеше Django, сигналы
+сохранения и удаления рецептов и их ингредиентов меняют её, и каждый
+процесс перестраивает индекс при следующем обращении. Без общего кеша
+индекс, как и справочник, живёт не дольше LOCAL_SNAPSHOT_TIMEOUT секунд.
+"""
+import threading
+import uuid
+from array import array
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .catalog import snapshot_version
+
+INGREDIENT_INDEX_VERSION_KEY = 'recipes:ingredient-index:version'
+
+Match = namedtuple('Match', ('recipe_id', 'matched', 'total'))
+
+
+class IngredientIndex:
+
+    def __init__(self, version, links):
+        self.version = version
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in links:
+            recipes[ingredient_id].add(recipe_id)
+        sizes = Counter()
+        for recipe_ids in recipes.values():
+            sizes.update(recipe_ids)
+        self._recipes = {
+            ingredient_id: array('q', sorted(recipe_ids))
+            for ingredient_id, recipe_ids in recipes.items()
+        }
+        self._sizes = dict(sizes)
+
+    def match(self, ingredient_ids, max_missing=None):
+        """Рецепты, где есть хотя бы один из ингредиентов.
+
+        Сортировка: доля имеющихся ингредиентов рецепта по убыванию,
+        затем меньше недостающих, затем новые рецепты. max_missing
+        отсекает рецепты, где не хватает больше max_missing ингредиентов.
+        """
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(self._recipes.get(ingredient_id, ()))
+        result = [
+            Match(recipe_id, count, self._sizes[recipe_id])
+            for recipe_id, count in matched.items()
+            if max_missing is None
+            or self._sizes[recipe_id] - count <= max_missing
+        ]
+        result.sort(key=lambda item: (
+            -item.matched / item.total,
+            item.total - item.matched,
+            -item.recipe_id,
+        ))
+        return result
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def load_ingredient_index(version):
+    from recipes.models import Recipe
+    return IngredientIndex(
+        version,
+        Recipe.ingredients.through.objects.values_list(
+            'recipe_id', 'ingredientinrecipe__ingredient_id',
+        ).order_by().iterator(),
+    )
+
+
+def get_ingredient_index():
+    global _index
+    version = snapshot_version(INGREDIENT_INDEX_VERSION_KEY)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = load_ingredient_index(version)
+        return _index
+
+
+def bump_ingredient_index_version():
+    """Помечает индексы устаревшими после фиксации текущей транзакции."""
+    transaction.on_commit(reset_ingredient_index)
+
+
+def reset_ingredient_index():
+    global _index
+    with _lock:
+        _index = None
+    if settings.CACHE_SHARED:
+        cache.set(INGREDIENT_INDEX_VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,68 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from recipes.images import RENDITIONS_DIR
+from recipes.models import Recipe
+
+
+def walk(storage, path):
+    """Имена всех файлов каталога хранилища, включая вложенные."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield os.path.join(path, name)
+    for directory in directories:
+        yield from walk(storage, os.path.join(path, directory))
+
+
+def stem(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class Command(BaseCommand):
+    help = 'Удаление картинок рецептов и их копий, на которые нет ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Не трогать файлы моложе этого числа часов: их рецепт '
+                 'может быть ещё не сохранён')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено')
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        upload_to = Recipe._meta.get_field('image').upload_to
+        references = Recipe.objects.image_references()
+        stems = {stem(name) for name in references}
+        deadline = timezone.now() - timedelta(hours=options['grace_hours'])
+        garbage = [
+            (storage, name, Q(image=name))
+            for name in walk(storage, upload_to)
+            if not references.get(name)
+        ] + [
+            (default_storage, name, Q(image__contains=f'/{image_stem}.'))
+            for name in walk(default_storage, RENDITIONS_DIR)
+            for image_stem in [stem(name).rsplit('-', 2)[0]]
+            if image_stem not in stems
+        ]
+        removed = freed = 0
+        for file_storage, name, reference in garbage:
+            if file_storage.get_modified_time(name) > deadline:
+                continue
+            # Пока шёл обход, картинку могли загрузить снова.
+            if Recipe.objects.filter(reference).exists():
+                continue
+            removed += 1
+            freed += file_storage.size(name)
+            if not options['dry_run']:
+                file_storage.delete(name)
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {removed}, {freed // 1024} КБ'))
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F
+from recipes.images import render_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Построение уменьшенных копий картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить копии всех рецептов, а не только новых')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число параллельных потоков')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only('id', 'image',
+                                                        'rendered_image')
+        if not options['all']:
+            recipes = recipes.exclude(rendered_image=F('image'))
+        recipes = list(recipes)
+        self.force = options['all']
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(options['workers']) as executor:
+                failed = sum(executor.map(self.render_in_thread, recipes))
+        else:
+            failed = sum(map(self.render, recipes))
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии построены: {len(recipes) - failed} рецептов'))
+        if failed:
+            self.stderr.write(f'Не удалось: {failed}')
+
+    def render(self, recipe):
+        try:
+            render_renditions(recipe, force=self.force)
+        except OSError as error:
+            self.stderr.write(f'Рецепт {recipe.id}: {error}')
+            return True
+        return False
+
+    def render_in_thread(self, recipe):
+        try:
+            return self.render(recipe)
+        finally:
+            close_old_connections()
@@ -1,22 +1,170 @@
 import csv
+import json
+import os
+from time import perf_counter
 
-from django.core.management.base import BaseCommand
+from api.response_cache import bump_generation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.catalog import bump_catalog_version
 from recipes.models import Ingredient
 
+DEFAULT_PATHS = ('./data/ingredients.csv', '../data/ingredients.csv')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if not row:
+            continue
+        name, measurement_unit = row
+        if name != 'name':
+            yield name, measurement_unit
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Читает массив объектов JSON по одному, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив ингредиентов')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError('Некорректный JSON с ингредиентами')
+            buffer += chunk
+            continue
+        yield item['name'], item['measurement_unit']
+        buffer = buffer[end:]
+
+
+def detect_format(path, file):
+    """Формат по расширению, а без него — по первому значимому символу."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.csv', '.json'):
+        return extension[1:]
+    head = file.read(64).lstrip()
+    file.seek(0)
+    return 'json' if head.startswith(('[', '{')) else 'csv'
+
+
+class DryRunError(Exception):
+    pass
+
 
 class Command(BaseCommand):
     help = 'Заполнение БД'
+    readers = {'csv': read_csv, 'json': read_json}
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Файл с ингредиентами в формате CSV или JSON',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для bulk_create',
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Обновить единицы измерения существующих ингредиентов',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Выполнить импорт и откатить транзакцию',
+        )
+
+    def get_path(self, path):
+        if path:
+            if not os.path.exists(path):
+                raise CommandError(f'Файл {path} не найден')
+            return path
+        for path in DEFAULT_PATHS:
+            if os.path.exists(path):
+                return path
+        raise CommandError('Файл с ингредиентами не найден, укажите --path')
+
+    def handle(self, *args, **options):
+        path = self.get_path(options['path'])
+        started = perf_counter()
+        try:
+            with transaction.atomic():
+                stats = self.load(path, options)
+                if options['dry_run']:
+                    raise DryRunError
+        except DryRunError:
+            pass
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            '{prefix}Прочитано {rows}, добавлено {created}, '
+            'обновлено {updated}, пропущено {skipped} '
+            'за {elapsed:.2f} с ({speed:.0f} строк/с)'.format(
+                prefix='[dry-run] ' if options['dry_run'] else '',
+                elapsed=elapsed,
+                speed=stats['rows'] / elapsed if elapsed else 0,
+                **stats,
+            )
+        ))
+
+    def load(self, path, options):
+        existing = dict(
+            Ingredient.objects.values_list('name', 'measurement_unit'))
+        stats = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+        batch, changed_units = [], {}
+        with open(path, newline='', encoding='UTF-8') as file:
+            reader = self.readers[detect_format(path, file)]
+            for name, measurement_unit in reader(file):
+                stats['rows'] += 1
+                if name not in existing:
+                    existing[name] = measurement_unit
+                    batch.append(Ingredient(
+                        name=name, measurement_unit=measurement_unit))
+                    if len(batch) >= options['batch_size']:
+                        stats['created'] += self.create(batch)
+                        batch = []
+                elif (options['update']
+                        and existing[name] != measurement_unit):
+                    existing[name] = measurement_unit
+                    changed_units[name] = measurement_unit
+                else:
+                    stats['skipped'] += 1
+        stats['created'] += self.create(batch)
+        stats['updated'] = self.update_units(changed_units)
+        if stats['created'] or stats['updated']:
+            # bulk_create и bulk_update не отправляют сигналов: справочник
+            # и закешированные карточки рецептов сбрасываются здесь.
+            bump_catalog_version()
+            bump_generation('ingredient')
+        return stats
+
+    def create(self, batch):
+        if not batch:
+            return 0
+        batch_size = connection.ops.bulk_batch_size(
+            ('name', 'measurement_unit'), batch)
+        Ingredient.objects.bulk_create(
+            batch, batch_size=batch_size, ignore_conflicts=True)
+        return len(batch)
 
-    def handle(self, *args, **kwargs):
-        with open('./data/ingredients.csv',
-                  newline='', encoding='UTF-8') as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, measurement_unit = row
-                if name != 'name':
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
-
-        self.stdout.write(self.style.SUCCESS('Successfully'))
+    def update_units(self, changed_units, chunk_size=500):
+        names = list(changed_units)
+        updated = 0
+        for start in range(0, len(names), chunk_size):
+            ingredients = list(Ingredient.objects.filter(
+                name__in=names[start:start + chunk_size]))
+            for ingredient in ingredients:
+                ingredient.measurement_unit = changed_units[ingredient.name]
+            Ingredient.objects.bulk_update(
+                ingredients, ('measurement_unit',))
+            updated += len(ingredients)
+        return updated
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from recipes.models import IngredientInRecipe
+
+
+class Command(BaseCommand):
+    help = 'Удаление количеств ингредиентов, не привязанных к рецептам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать строки, ничего не удаляя',
+        )
+
+    def handle(self, *args, **options):
+        orphans = IngredientInRecipe.objects.orphans()
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'[dry-run] Строк без рецепта: {orphans.count()}'))
+            return
+        deleted = IngredientInRecipe.objects.delete_orphans()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено строк без рецепта: {deleted}'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.counters import rebuild_counters, stale_counters
+
+
+class Command(BaseCommand):
+    help = 'Сверка счётчиков избранного, корзин, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить счётчики, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            stale = stale_counters()
+            if stale:
+                raise CommandError('Расхождений в счётчиках: {}'.format(
+                    ', '.join(
+                        f'{model._meta.model_name}.{field}={len(actual)}'
+                        for model, field, actual in stale
+                    )
+                ))
+            self.stdout.write(self.style.SUCCESS('Счётчики совпадают'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: {rebuild_counters()}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from recipes.models import RecipeRank
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт рейтинга популярности рецептов за последние дни'
+
+    def handle(self, *args, **options):
+        ranked = RecipeRank.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан: {ranked} рецептов'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт таблицы итогов корзин покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить таблицу с корзинами, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        expected = ShoppingCartTotal.objects.calculate()
+        if options['verify']:
+            stored = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in (
+                    ShoppingCartTotal.objects.values_list(
+                        'user_id', 'ingredient_id', 'amount')
+                )
+            }
+            mismatched = {
+                key for key in {*expected, *stored}
+                if expected.get(key) != stored.get(key)
+            }
+            if mismatched:
+                raise CommandError(
+                    f'Расхождений в итогах корзин: {len(mismatched)}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Итоги корзин совпадают: {len(stored)} строк'))
+            return
+        with transaction.atomic():
+            ShoppingCartTotal.objects.all().delete()
+            ShoppingCartTotal.objects.bulk_create(
+                ShoppingCartTotal(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for (user_id, ingredient_id), amount in expected.items()
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги корзин пересчитаны: {len(expected)} строк'))
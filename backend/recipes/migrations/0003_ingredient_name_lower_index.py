@@ -0,0 +1,49 @@
+from django.db import migrations
+
+INDEXES = {
+    'sqlite': (
+        (
+            'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_lower '
+            'ON recipes_ingredient (lower(name))',
+            'DROP INDEX IF EXISTS recipes_ingredient_name_lower',
+        ),
+    ),
+    'postgresql': (
+        (
+            'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_lower '
+            'ON recipes_ingredient (lower(name) text_pattern_ops)',
+            'DROP INDEX IF EXISTS recipes_ingredient_name_lower',
+        ),
+        (
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            None,
+        ),
+        (
+            'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+            'ON recipes_ingredient USING gin (lower(name) gin_trgm_ops)',
+            'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+        ),
+    ),
+}
+
+
+def create_indexes(apps, schema_editor):
+    for create, _ in INDEXES.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(create)
+
+
+def drop_indexes(apps, schema_editor):
+    for _, drop in reversed(INDEXES.get(schema_editor.connection.vendor, ())):
+        if drop:
+            schema_editor.execute(drop)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_shoppingcarttotal'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,245 @@
+from django.db import migrations
+
+# Названия ингредиентов рецепта одной строкой.
+INGREDIENT_NAMES = '''
+    SELECT {aggregate}
+    FROM recipes_recipe_ingredients link
+    JOIN recipes_ingredientinrecipe amount
+        ON amount.id = link.ingredientinrecipe_id
+    JOIN recipes_ingredient ingredient ON ingredient.id = amount.ingredient_id
+    WHERE link.recipe_id = {recipe_id}
+'''
+
+# Рецепты, в которых встречается ингредиент.
+INGREDIENT_RECIPES = '''
+    SELECT link.recipe_id
+    FROM recipes_recipe_ingredients link
+    JOIN recipes_ingredientinrecipe amount
+        ON amount.id = link.ingredientinrecipe_id
+    WHERE amount.ingredient_id = NEW.id
+'''
+
+PG_NAMES = INGREDIENT_NAMES.format(
+    aggregate="string_agg(ingredient.name, ' ')", recipe_id='$1')
+SQLITE_AGGREGATE = "coalesce(group_concat(ingredient.name, ' '), '')"
+SQLITE_NEW_NAMES, SQLITE_OLD_NAMES, SQLITE_FTS_NAMES, SQLITE_ROW_NAMES = (
+    INGREDIENT_NAMES.format(aggregate=SQLITE_AGGREGATE, recipe_id=recipe_id)
+    for recipe_id in (
+        'NEW.recipe_id',
+        'OLD.recipe_id',
+        'recipes_recipe_fts.rowid',
+        'recipes_recipe.id',
+    )
+)
+
+# PostgreSQL: вектор хранится в столбце recipes_recipe.search_vector
+# с GIN-индексом; столбец не объявлен в модели и заполняется триггерами.
+# SQLite: таблица FTS5 recipes_recipe_fts с rowid = id рецепта.
+# SQLite пересоздаёт таблицу при части ALTER TABLE и теряет её триггеры:
+# миграция, меняющая recipes_recipe так, должна создать их заново.
+SEARCH_SQL = {
+    'postgresql': (
+        (
+            'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+            'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+        ),
+        (
+            'CREATE INDEX recipes_recipe_search_vector '
+            'ON recipes_recipe USING gin (search_vector)',
+            'DROP INDEX IF EXISTS recipes_recipe_search_vector',
+        ),
+        (
+            f'''
+            CREATE FUNCTION recipes_recipe_search_vector(
+                recipe_id integer, recipe_name text, recipe_text text
+            ) RETURNS tsvector AS $$
+                SELECT setweight(
+                        to_tsvector('russian', coalesce(recipe_name, '')), 'A')
+                    || setweight(
+                        to_tsvector('russian', coalesce(recipe_text, '')), 'B')
+                    || setweight(to_tsvector(
+                        'russian', coalesce(({PG_NAMES}), '')), 'C')
+            $$ LANGUAGE sql STABLE
+            ''',
+            'DROP FUNCTION IF EXISTS '
+            'recipes_recipe_search_vector(integer, text, text)',
+        ),
+        (
+            '''
+            CREATE FUNCTION recipes_recipe_search_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := recipes_recipe_search_vector(
+                    NEW.id, NEW.name, NEW.text);
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP FUNCTION IF EXISTS recipes_recipe_search_trigger()',
+        ),
+        (
+            'CREATE TRIGGER recipes_recipe_search '
+            'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+            'FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_trigger()',
+            'DROP TRIGGER IF EXISTS recipes_recipe_search ON recipes_recipe',
+        ),
+        (
+            '''
+            CREATE FUNCTION recipes_recipe_links_search_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                UPDATE recipes_recipe
+                SET search_vector = recipes_recipe_search_vector(
+                    id, name, text)
+                WHERE id IN (SELECT recipe_id FROM changed_links);
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP FUNCTION IF EXISTS recipes_recipe_links_search_trigger()',
+        ),
+        (
+            'CREATE TRIGGER recipes_recipe_links_insert_search '
+            'AFTER INSERT ON recipes_recipe_ingredients '
+            'REFERENCING NEW TABLE AS changed_links FOR EACH STATEMENT '
+            'EXECUTE PROCEDURE recipes_recipe_links_search_trigger()',
+            'DROP TRIGGER IF EXISTS recipes_recipe_links_insert_search '
+            'ON recipes_recipe_ingredients',
+        ),
+        (
+            'CREATE TRIGGER recipes_recipe_links_delete_search '
+            'AFTER DELETE ON recipes_recipe_ingredients '
+            'REFERENCING OLD TABLE AS changed_links FOR EACH STATEMENT '
+            'EXECUTE PROCEDURE recipes_recipe_links_search_trigger()',
+            'DROP TRIGGER IF EXISTS recipes_recipe_links_delete_search '
+            'ON recipes_recipe_ingredients',
+        ),
+        (
+            f'''
+            CREATE FUNCTION recipes_ingredient_search_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                UPDATE recipes_recipe
+                SET search_vector = recipes_recipe_search_vector(
+                    id, name, text)
+                WHERE id IN ({INGREDIENT_RECIPES});
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP FUNCTION IF EXISTS recipes_ingredient_search_trigger()',
+        ),
+        (
+            'CREATE TRIGGER recipes_ingredient_search '
+            'AFTER UPDATE OF name ON recipes_ingredient FOR EACH ROW '
+            'WHEN (OLD.name IS DISTINCT FROM NEW.name) '
+            'EXECUTE PROCEDURE recipes_ingredient_search_trigger()',
+            'DROP TRIGGER IF EXISTS recipes_ingredient_search '
+            'ON recipes_ingredient',
+        ),
+        (
+            'UPDATE recipes_recipe SET search_vector = '
+            'recipes_recipe_search_vector(id, name, text)',
+            None,
+        ),
+    ),
+    'sqlite': (
+        (
+            'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+            'name, text, ingredients, '
+            "tokenize = 'unicode61 remove_diacritics 2')",
+            'DROP TABLE IF EXISTS recipes_recipe_fts',
+        ),
+        (
+            '''
+            CREATE TRIGGER recipes_recipe_fts_insert
+            AFTER INSERT ON recipes_recipe BEGIN
+                INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+                VALUES (NEW.id, NEW.name, NEW.text, '');
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+        ),
+        (
+            '''
+            CREATE TRIGGER recipes_recipe_fts_update
+            AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+                UPDATE recipes_recipe_fts SET name = NEW.name, text = NEW.text
+                WHERE rowid = NEW.id;
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+        ),
+        (
+            '''
+            CREATE TRIGGER recipes_recipe_fts_delete
+            AFTER DELETE ON recipes_recipe BEGIN
+                DELETE FROM recipes_recipe_fts WHERE rowid = OLD.id;
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+        ),
+        (
+            f'''
+            CREATE TRIGGER recipes_recipe_links_fts_insert
+            AFTER INSERT ON recipes_recipe_ingredients BEGIN
+                UPDATE recipes_recipe_fts SET ingredients = ({SQLITE_NEW_NAMES})
+                WHERE rowid = NEW.recipe_id;
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS recipes_recipe_links_fts_insert',
+        ),
+        (
+            f'''
+            CREATE TRIGGER recipes_recipe_links_fts_delete
+            AFTER DELETE ON recipes_recipe_ingredients BEGIN
+                UPDATE recipes_recipe_fts SET ingredients = ({SQLITE_OLD_NAMES})
+                WHERE rowid = OLD.recipe_id;
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS recipes_recipe_links_fts_delete',
+        ),
+        (
+            f'''
+            CREATE TRIGGER recipes_ingredient_fts_update
+            AFTER UPDATE OF name ON recipes_ingredient
+            WHEN OLD.name IS NOT NEW.name BEGIN
+                UPDATE recipes_recipe_fts SET ingredients = ({SQLITE_FTS_NAMES})
+                WHERE rowid IN ({INGREDIENT_RECIPES});
+            END
+            ''',
+            'DROP TRIGGER IF EXISTS recipes_ingredient_fts_update',
+        ),
+        (
+            f'''
+            INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+            SELECT id, name, text, ({SQLITE_ROW_NAMES})
+            FROM recipes_recipe
+            ''',
+            None,
+        ),
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    for create, _ in SEARCH_SQL.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(create)
+
+
+def drop_search_index(apps, schema_editor):
+    for _, drop in reversed(
+            SEARCH_SQL.get(schema_editor.connection.vendor, ())):
+        if drop:
+            schema_editor.execute(drop)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_rank'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:19
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+SEARCH_SQL = import_module('recipes.migrations.0007_recipe_search').SEARCH_SQL
+
+# SQLite пересоздаёт recipes_recipe при добавлении и удалении столбца и
+# теряет триггеры поискового индекса на этой таблице.
+RECIPE_TRIGGERS = (
+    'recipes_recipe_fts_insert',
+    'recipes_recipe_fts_update',
+    'recipes_recipe_fts_delete',
+)
+
+
+def recreate_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for create, drop in SEARCH_SQL['sqlite']:
+        if drop and drop.split()[-1] in RECIPE_TRIGGERS:
+            schema_editor.execute(drop)
+            schema_editor.execute(create)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            migrations.RunPython.noop, recreate_search_triggers),
+        migrations.AddField(
+            model_name='recipe',
+            name='rendered_image',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Картинка с готовыми копиями'),
+        ),
+        migrations.RunPython(
+            recreate_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:21
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_rendered_image'),
+    ]
+
+    # Хранилище не меняет столбец, а SQLite пересоздал бы таблицу.
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='recipe',
+                name='image',
+                field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Картинка'),
+            ),
+        ]),
+    ]
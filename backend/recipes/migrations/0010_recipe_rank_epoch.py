@@ -0,0 +1,34 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+# Прежняя постоянная точка отсчёта: от неё посчитаны уже сохранённые
+# рейтинги (2024-01-01 UTC).
+PREVIOUS_EPOCH = 1704067200.0
+
+
+def create_epoch(apps, schema_editor):
+    apps.get_model('recipes', 'RecipeRankEpoch').objects.using(
+        schema_editor.connection.alias).create(pk=1, epoch=PREVIOUS_EPOCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRankEpoch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.FloatField(verbose_name='Точка отсчёта, секунды Unix')),
+            ],
+            options={
+                'verbose_name': 'Точка отсчёта рейтинга',
+                'verbose_name_plural': 'Точки отсчёта рейтинга',
+            },
+        ),
+        migrations.RunPython(create_epoch, migrations.RunPython.noop),
+    ]
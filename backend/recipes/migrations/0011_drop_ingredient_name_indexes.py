@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Индексы по названию ингредиента служили автодополнению, которое теперь
+# идёт по каталогу в памяти. pg_trgm больше ничем не используется:
+# расширение удаляется, если роль миграций владеет им и на него не
+# опираются другие объекты базы.
+SQL = {
+    'sqlite': (
+        'DROP INDEX IF EXISTS recipes_ingredient_name_lower',
+    ),
+    'postgresql': (
+        'DROP INDEX IF EXISTS recipes_ingredient_name_lower',
+        'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+        '''
+        DO $$
+        BEGIN
+            DROP EXTENSION IF EXISTS pg_trgm;
+        EXCEPTION
+            WHEN insufficient_privilege OR dependent_objects_still_exist
+            THEN NULL;
+        END
+        $$
+        ''',
+    ),
+}
+
+
+def drop_indexes(apps, schema_editor):
+    for sql in SQL.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_rank_epoch'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_indexes, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,21 @@
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
-from users.models import User
+from django.db import connections, models, transaction
+from django.db.models import (Count, ExpressionWrapper, F, FloatField,
+                              Prefetch, Q, Subquery, Sum, Value, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Power, RowNumber
+from django.utils import timezone
+from users.models import UniquePairQuerySet, User
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -40,6 +54,56 @@ class Ingredient(models.Model):
         return f'{self.name}'
 
 
+class IngredientInRecipeQuerySet(models.QuerySet):
+
+    def orphans(self):
+        """Строки, не привязанные ни к одному рецепту."""
+        return self.filter(recipes__isnull=True)
+
+    def delete_orphans(self, chunk_size=500):
+        """Удаляет строки без рецепта, не отправляя сигналов удаления.
+
+        Такая строка не входит ни в одну карточку рецепта и ни в один
+        индекс, поэтому сбрасывать кеши нечего, а приёмникам пришлось бы
+        запрашивать связи каждой строки. Строку, которую успели привязать
+        к рецепту после выборки, условие NOT EXISTS оставляет на месте.
+        """
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        pk = quote(self.model._meta.pk.column)
+        through = Recipe.ingredients.through._meta
+        link_column = quote(
+            through.get_field('ingredientinrecipe').column)
+        ids = list(self.orphans().values_list('id', flat=True))
+        deleted = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE {pk} IN '
+                    f'({", ".join(["%s"] * len(chunk))}) AND NOT EXISTS ('
+                    f'SELECT 1 FROM {quote(through.db_table)} link '
+                    f'WHERE link.{link_column} = {table}.{pk})',
+                    chunk,
+                )
+                deleted += cursor.rowcount
+        return deleted
+
+    def bulk_create_with_ids(self, objs):
+        """bulk_create, после которого у всех объектов заполнен pk.
+
+        PostgreSQL возвращает id из INSERT сам. Остальные базы в Django
+        2.2 этого не умеют, и строки вставляются по одной.
+        """
+        objs = list(objs)
+        if connections[self.db].features.can_return_ids_from_bulk_insert:
+            return self.bulk_create(objs)
+        for obj in objs:
+            obj.save(force_insert=True, using=self.db)
+        return objs
+
+
 class IngredientInRecipe(models.Model):
     ingredient = models.ForeignKey(
         Ingredient,
@@ -48,6 +112,8 @@ class IngredientInRecipe(models.Model):
     )
     amount = models.PositiveIntegerField(verbose_name='Количество')
 
+    objects = IngredientInRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Количество ингридиента'
         verbose_name_plural = 'Количество ингридиентов'
@@ -56,6 +122,91 @@ class IngredientInRecipe(models.Model):
         return f'{self.ingredient} * {self.amount}'
 
 
+def read_prefetches():
+    """Связи рецепта, которые нужны для его карточки."""
+    return (
+        'tags',
+        Prefetch(
+            'ingredients',
+            queryset=IngredientInRecipe.objects.select_related('ingredient'),
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def image_references(self):
+        """Число рецептов на каждый файл картинки: {имя: число}."""
+        return dict(self.exclude(image='').values_list('image').annotate(
+            references=Count('id')).order_by())
+
+    def top_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора одним запросом.
+
+        Django 2.2 не умеет фильтровать по оконной функции, поэтому
+        нумерация ROW_NUMBER() считается во вложенном запросе, а отбор
+        делается в обёртке через raw().
+        """
+        ranked = self.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc()),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.db_manager(self.db).raw(
+            f'SELECT * FROM ({sql}) ranked '
+            'WHERE ranked.row_number <= %s '
+            'ORDER BY ranked.author_id, ranked.row_number',
+            (*params, limit),
+        )
+
+    def search(self, query):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам.
+
+        Добавляет аннотацию search_rank (больше — релевантнее). В
+        PostgreSQL ищет по столбцу search_vector с GIN-индексом, в SQLite —
+        по таблице FTS5 с поиском по префиксам слов; обе поддерживаются
+        триггерами миграции 0007. На других базах ищется вхождение слов
+        в название и описание без ранжирования.
+        """
+        words = re.findall(r'\w+', query)
+        if not words:
+            return self.annotate(search_rank=Value(0.0, FloatField())).none()
+        vendor = connections[self.db].vendor
+        if vendor == 'postgresql':
+            tsquery = "plainto_tsquery('russian', %s)"
+            return self.extra(
+                where=[f'recipes_recipe.search_vector @@ {tsquery}'],
+                params=[query],
+            ).annotate(search_rank=RawSQL(
+                f'ts_rank(recipes_recipe.search_vector, {tsquery})',
+                (query,),
+                output_field=FloatField(),
+            ))
+        if vendor == 'sqlite':
+            match = ' '.join(f'"{word}"*' for word in words)
+            return self.extra(
+                where=[
+                    'recipes_recipe.id IN (SELECT rowid '
+                    'FROM recipes_recipe_fts '
+                    'WHERE recipes_recipe_fts MATCH %s)'
+                ],
+                params=[match],
+            ).annotate(search_rank=RawSQL(
+                # Веса столбцов: название, описание, ингредиенты.
+                'SELECT -bm25(recipes_recipe_fts, 10.0, 4.0, 1.0) '
+                'FROM recipes_recipe_fts '
+                'WHERE recipes_recipe_fts MATCH %s '
+                'AND rowid = recipes_recipe.id',
+                (match,),
+                output_field=FloatField(),
+            ))
+        return self.filter(reduce(and_, (
+            Q(name__icontains=word) | Q(text__icontains=word)
+            for word in words
+        ))).annotate(search_rank=Value(0.0, FloatField()))
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag,
@@ -79,8 +230,15 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=ContentAddressedStorage(),
         verbose_name='Картинка',
     )
+    rendered_image = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Картинка с готовыми копиями',
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -96,16 +254,231 @@ class Recipe(models.Model):
                 1, message='Минимальное время приготовления - 1 минута!'),
         )
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date', )
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipes_recipe_pub_date_id',
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipes_recipe_favorites_id',
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+# Точка отсчёта переносится к текущему моменту, когда веса новых событий
+# достигают 2 ** RANK_EPOCH_MAX_HALF_LIVES: так они не выходят за float.
+RANK_EPOCH_MAX_HALF_LIVES = 256
+
+
+class RecipeRankQuerySet(models.QuerySet):
+    """Рейтинг популярности с экспоненциальным затуханием.
+
+    Событие (добавление в избранное или корзину) весит
+    rank_weight * 2 ** ((время - точка отсчёта) / период полураспада).
+    Все веса отсчитаны от одной точки, поэтому порядок рецептов по сумме
+    тот же, что по весам, затухшим к текущему моменту, а новое событие
+    прибавляется к сумме без пересчёта остальных. Точка отсчёта хранится
+    в RecipeRankEpoch: пересчёт рейтинга ставит её на текущий момент, а
+    если пересчёт давно не запускался, она переносится вперёд с
+    уменьшением сохранённых сумм, и веса не переполняют float при любом
+    периоде полураспада.
+    """
+
+    @staticmethod
+    def half_life():
+        return timedelta(
+            days=settings.RECIPE_RANK_HALF_LIFE_DAYS).total_seconds()
+
+    @staticmethod
+    def weight_at(moment, epoch):
+        """Вес события момента moment относительно точки отсчёта epoch."""
+        return 2 ** ((moment.timestamp() - epoch) / timedelta(
+            days=settings.RECIPE_RANK_HALF_LIFE_DAYS).total_seconds())
+
+    @staticmethod
+    def window_start(now=None):
+        return (now or timezone.now()) - timedelta(
+            days=settings.RECIPE_RANK_WINDOW_DAYS)
+
+    def epoch(self):
+        return RecipeRankEpoch.objects.using(self.db).values_list(
+            'epoch', flat=True).first()
+
+    def move_epoch(self, epoch):
+        """Переносит точку отсчёта вперёд, уменьшая рейтинги так же."""
+        with transaction.atomic(using=self.db):
+            current, _ = RecipeRankEpoch.objects.using(
+                self.db).select_for_update().get_or_create(
+                pk=1, defaults={'epoch': epoch})
+            if epoch > current.epoch:
+                self.all().update(score=F('score') * 2 ** (
+                    (current.epoch - epoch) / self.half_life()))
+                current.epoch = epoch
+                current.save(update_fields=('epoch',))
+
+    def add_event(self, recipe_id, moment, value):
+        """Прибавляет событие момента moment весом value одним upsert.
+
+        Вес считается в том же запросе относительно точки отсчёта в базе,
+        которую upsert блокирует на чтение, пока идёт пересчёт рейтинга.
+        Если точка отстала настолько, что вес вышел бы за float, upsert
+        ничего не меняет: точка переносится, и событие добавляется снова.
+        """
+        half_life = self.half_life()
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        epochs = quote(RecipeRankEpoch._meta.db_table)
+        key, score, epoch = quote('recipe_id'), quote('score'), quote('epoch')
+        lock = (
+            ' FOR SHARE' if connection.features.has_select_for_update else '')
+        for _ in range(2):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} ({key}, {score}) '
+                    f'SELECT %s, %s * POWER(2, (%s - {epoch}) / %s) '
+                    f'FROM {epochs} WHERE {quote("id")} = 1 '
+                    f'AND %s - {epoch} <= %s{lock} '
+                    f'ON CONFLICT ({key}) DO UPDATE '
+                    f'SET {score} = {table}.{score} + EXCLUDED.{score}',
+                    (recipe_id, value, moment.timestamp(), half_life,
+                     moment.timestamp(),
+                     RANK_EPOCH_MAX_HALF_LIVES * half_life),
+                )
+                if cursor.rowcount:
+                    return
+            self.move_epoch(timezone.now().timestamp())
+        raise RuntimeError('Не удалось перенести точку отсчёта рейтинга')
+
+    def min_score(self, now=None):
+        """Вес самого лёгкого события на границе окна.
+
+        Рейтинг ниже него бывает только у рецептов без свежих событий
+        и как остаток округления после вычитания удалённых событий.
+        Подзапрос читает точку отсчёта в том же запросе, что и рейтинги.
+        """
+        lightest = min(model.rank_weight for model in RANKED_MODELS)
+        exponent = (
+            Value(self.window_start(now).timestamp(), FloatField())
+            - F('epoch')
+        ) / Value(self.half_life(), FloatField())
+        return Subquery(RecipeRankEpoch.objects.filter(pk=1).annotate(
+            threshold=ExpressionWrapper(
+                Value(float(lightest), FloatField())
+                * Power(Value(2.0, FloatField()), exponent),
+                FloatField(),
+            ),
+        ).values('threshold'))
+
+    def calculate(self, now=None, epoch=None):
+        """Считает рейтинги заново по событиям окна: {recipe_id: score}.
+
+        Веса отсчитываются от epoch, по умолчанию — от точки в базе.
+        """
+        if epoch is None:
+            epoch = self.epoch()
+        scores = defaultdict(float)
+        for model in RANKED_MODELS:
+            events = model.objects.filter(
+                created__gte=self.window_start(now),
+            ).values_list('recipe_id', 'created').order_by()
+            for recipe_id, created in events.iterator():
+                scores[recipe_id] += (
+                    model.rank_weight * self.weight_at(created, epoch))
+        return scores
+
+    def rebuild(self, now=None):
+        # Событие, зафиксированное между подсчётом и заменой таблицы,
+        # пропадёт до следующего запуска команды.
+        epoch = (now or timezone.now()).timestamp()
+        scores = self.calculate(now, epoch)
+        with transaction.atomic(using=self.db):
+            # Сначала точка отсчёта: upsert событий ждут её блокировки.
+            RecipeRankEpoch.objects.using(self.db).update_or_create(
+                pk=1, defaults={'epoch': epoch})
+            self.all().delete()
+            self.bulk_create(
+                self.model(recipe_id=recipe_id, score=score)
+                for recipe_id, score in scores.items()
+            )
+        return len(scores)
+
+
+class RecipeRank(models.Model):
+    """Предрасчитанный рейтинг популярности рецепта."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rank',
+        verbose_name='Рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Рейтинг',
+        default=0,
+    )
+
+    objects = RecipeRankQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = (
+            models.Index(
+                fields=('-score', '-recipe'),
+                name='recipes_rank_score_recipe',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score}'
+
+
+class RecipeRankEpoch(models.Model):
+    """Точка отсчёта весов рейтинга популярности (одна строка)."""
+    epoch = models.FloatField(verbose_name='Точка отсчёта, секунды Unix')
+
+    class Meta:
+        verbose_name = 'Точка отсчёта рейтинга'
+        verbose_name_plural = 'Точки отсчёта рейтинга'
+
+    def __str__(self):
+        return str(datetime.fromtimestamp(self.epoch, timezone.utc))
+
+
+class RecipePairQuerySet(UniquePairQuerySet):
+    """Связи с рецептом, которые учитываются в рейтинге популярности."""
+
+    def pair_changed(self, obj, delta):
+        super().pair_changed(obj, delta)
+        if delta < 0 and obj.created < RecipeRank.objects.window_start():
+            # Событие старше окна уже не входит в пересчитанный рейтинг.
+            return
+        RecipeRank.objects.db_manager(self.db).add_event(
+            obj.recipe_id, obj.created, delta * self.model.rank_weight)
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -119,6 +492,15 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт',
     )
+    created = models.DateTimeField(
+        verbose_name='Добавлен',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    objects = RecipePairQuerySet.as_manager()
+    pair_counter = ('recipe', 'favorites_count')
+    rank_weight = 1.0
 
     class Meta:
         ordering = ('-id',)
@@ -151,6 +533,15 @@ class ShoppingCart(models.Model):
         related_name='shoppingcart',
         verbose_name='Рецепт',
     )
+    created = models.DateTimeField(
+        verbose_name='Добавлен',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    objects = RecipePairQuerySet.as_manager()
+    pair_counter = ('recipe', 'in_carts_count')
+    rank_weight = 0.5
 
     class Meta:
         ordering = ('-id',)
@@ -168,3 +559,154 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил рецепт {self.recipe}'
+
+
+RANKED_MODELS = (Favorite, ShoppingCart)
+
+
+class ShoppingCartTotalQuerySet(models.QuerySet):
+
+    def add_recipe(self, user, recipe):
+        self.apply((user.id,), recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.apply((user.id,), {
+            ingredient_id: -amount
+            for ingredient_id, amount in recipe_amounts(recipe).items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение ингредиентов рецепта в корзины с ним."""
+        deltas = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        self.apply(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True),
+            deltas,
+        )
+
+    def apply(self, user_ids, deltas):
+        """Прибавляет deltas {ingredient_id: amount} к итогам пользователей.
+
+        Выполняется за постоянное число запросов. Прибавления пишутся
+        одним INSERT ... ON CONFLICT DO UPDATE: одновременные запросы,
+        добавляющие один и тот же новый ингредиент, складываются, а не
+        получают IntegrityError. Вычитания меняют только существующие
+        строки: чтение с блокировкой, одно массовое обновление и одно
+        удаление обнулившихся строк.
+        """
+        deltas = {key: value for key, value in deltas.items() if value}
+        user_ids = list(user_ids)
+        if not deltas or not user_ids:
+            return
+        added = {key: value for key, value in deltas.items() if value > 0}
+        removed = {key: value for key, value in deltas.items() if value < 0}
+        with transaction.atomic(using=self.db, savepoint=False):
+            if added:
+                self._add_amounts([
+                    (user_id, ingredient_id, amount)
+                    for user_id in user_ids
+                    for ingredient_id, amount in added.items()
+                ])
+            if not removed:
+                return
+            changed, emptied = [], []
+            for total in self.select_for_update().filter(
+                    user_id__in=user_ids, ingredient_id__in=removed):
+                total.amount += removed[total.ingredient_id]
+                if total.amount > 0:
+                    changed.append(total)
+                else:
+                    emptied.append(total.id)
+            if changed:
+                self.bulk_update(changed, ('amount',))
+            if emptied:
+                self.filter(id__in=emptied).delete()
+
+    def _add_amounts(self, rows):
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        columns = ('user_id', 'ingredient_id', 'amount')
+        amount = quote('amount')
+        batch_size = connection.ops.bulk_batch_size(columns, rows)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f'INSERT INTO {table} '
+                    f'({", ".join(quote(column) for column in columns)}) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT ({quote("user_id")}, '
+                    f'{quote("ingredient_id")}) DO UPDATE '
+                    f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                    [value for row in batch for value in row],
+                )
+
+    def calculate(self):
+        """Считает итоги заново по корзинам: {(user_id, ingredient_id): n}."""
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in (
+                IngredientInRecipe.objects.filter(
+                    recipes__shoppingcart__isnull=False,
+                ).values_list(
+                    'recipes__shoppingcart__user', 'ingredient',
+                ).annotate(total=Sum('amount')).order_by()
+            )
+        }
+
+
+class ShoppingCartTotal(models.Model):
+    """Денормализованные итоги корзины: сумма ингредиента по рецептам."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingCartTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Итог корзины'
+        verbose_name_plural = 'Итоги корзин'
+        constraints = [
+            models.UniqueConstraint(
+                fields=(
+                    'user',
+                    'ingredient',
+                ),
+                name='unique_shoppingcarttotal_user_ingredient',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} * {self.amount}'
+
+
+def recipe_amounts(recipe):
+    """Количества ингредиентов рецепта: {ingredient_id: amount}.
+
+    Принимает рецепт или уже загруженные строки IngredientInRecipe.
+    """
+    if isinstance(recipe, Recipe):
+        rows = recipe.ingredients.values_list('ingredient_id', 'amount')
+    else:
+        rows = ((row.ingredient_id, row.amount) for row in recipe)
+    amounts = {}
+    for ingredient_id, amount in rows:
+        amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+    return amounts
@@ -0,0 +1,88 @@
+"""Множества id избранного, корзины и подписок пользователя в кеше.
+
+Проверки «в избранном», «в корзине» и «подписан» нужны почти в каждом
+ответе. Множества пользователя лежат в кеше Django вместе с версиями и
+читаются одним обращением; при промахе каждое загружается одним
+запросом. Действия API, меняющие связи, после фиксации транзакции
+записывают новую версию множества, и оно перечитывается из базы при
+следующем обращении: одновременные переключения не затирают друг друга,
+а расхождение (например, после правки в админке) исправляется при первом
+же переключении. Кеш в памяти процесса при нескольких процессах
+(CACHE_SHARED=False) не используется: другие процессы не узнали бы об
+изменениях.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, ShoppingCart
+from users.models import Subscription
+
+RELATIONS = {
+    'favorites': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'recipe_id'),
+    'subscriptions': (Subscription, 'author_id'),
+}
+RELATIONS_KEY = 'recipes:relations:{}:{}'
+RELATIONS_VERSION_KEY = 'recipes:relations-version:{}:{}'
+
+
+def relations_key(user_id, name):
+    return RELATIONS_KEY.format(user_id, name)
+
+
+def version_key(user_id, name):
+    return RELATIONS_VERSION_KEY.format(user_id, name)
+
+
+def load_ids(user_id, name):
+    model, field = RELATIONS[name]
+    return frozenset(
+        model.objects.filter(user_id=user_id).values_list(field, flat=True))
+
+
+def get_versions(user_id, cached):
+    """Версии множеств; недостающие создаются."""
+    versions = {}
+    for name in RELATIONS:
+        key = version_key(user_id, name)
+        if key not in cached:
+            cache.add(key, uuid.uuid4().hex, None)
+            cached[key] = cache.get(key)
+        versions[name] = cached[key]
+    return versions
+
+
+def get_relations(user):
+    """Словарь {имя связи: frozenset id} для пользователя."""
+    if not user.is_authenticated:
+        return {name: frozenset() for name in RELATIONS}
+    if not settings.CACHE_SHARED:
+        return {name: load_ids(user.id, name) for name in RELATIONS}
+    keys = {name: relations_key(user.id, name) for name in RELATIONS}
+    cached = cache.get_many([
+        *keys.values(),
+        *(version_key(user.id, name) for name in RELATIONS),
+    ])
+    # Версия читается до базы: если связь изменят, пока идёт загрузка,
+    # множество сохранится со старой версией и не подойдёт.
+    versions = get_versions(user.id, cached)
+    relations, missing = {}, {}
+    for name, key in keys.items():
+        entry = cached.get(key)
+        if entry is not None and entry[0] == versions[name]:
+            relations[name] = entry[1]
+        else:
+            relations[name] = load_ids(user.id, name)
+            missing[key] = (versions[name], relations[name])
+    if missing:
+        cache.set_many(missing, settings.USER_RELATIONS_CACHE_TIMEOUT)
+    return relations
+
+
+def bump_relation(user_id, name):
+    """Делает закешированное множество устаревшим после фиксации."""
+    key = version_key(user_id, name)
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
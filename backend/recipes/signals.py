@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .ingredient_index import bump_ingredient_index_version
+from .models import Ingredient, IngredientInRecipe, Recipe, Tag
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def invalidate_ingredient_index(sender, update_fields=None, **kwargs):
+    # Состав рецепта через API меняется вместе с полным сохранением
+    # рецепта; частичное (например, отметка о копиях картинки) его не
+    # трогает.
+    if update_fields:
+        return
+    bump_ingredient_index_version()
@@ -0,0 +1,46 @@
+"""Хранилище картинок рецептов с адресацией по содержимому.
+
+Файл сохраняется под SHA-256 своего содержимого:
+recipes/images/ab/abcdef….png. Повторная загрузка тех же байтов ничего
+не пишет и возвращает уже существующее имя, поэтому один файл может
+принадлежать нескольким рецептам. Раз содержимое по имени не меняется,
+файлы можно отдавать с бессрочным кешированием. Django не удаляет файлы
+вместе с рецептами; файлы без ссылок, не менявшиеся дольше срока
+ожидания, удаляет команда collect_media_garbage.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Имя задаёт содержимое, подбирать свободное не нужно.
+        return name
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Повторная загрузка молодит файл: сборщик мусора не удалит
+            # его, пока рецепт с этой картинкой ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        # Запись во временное имя и переименование: параллельная загрузка
+        # тех же байтов заменит файл таким же, а не оборвётся на нём.
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -0,0 +1,231 @@
+import base64
+import csv
+import os
+import random
+from collections import defaultdict
+from io import BytesIO, StringIO
+from time import perf_counter
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import CachedTokenAuthentication
+from recipes.catalog import get_catalog
+from recipes.ingredient_index import get_ingredient_index
+from recipes.relations import get_relations
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+USERS_COUNT = 30
+RECIPES_COUNT = 120
+INGREDIENTS_PER_RECIPE = 10
+TAGS_COUNT = 3
+BENCH_ROUNDS = int(os.getenv('BENCH_ROUNDS', 5))
+INGREDIENTS_CSV = os.path.join(
+    os.path.dirname(settings.BASE_DIR), 'data', 'ingredients.csv')
+
+LATENCIES = defaultdict(list)
+
+
+def seed_dataset():
+    """Синтетический набор данных для бенчмарков, общий на всю сессию."""
+    rnd = random.Random(42)
+    with open(INGREDIENTS_CSV, newline='', encoding='UTF-8') as file:
+        units = {}
+        for name, unit in csv.reader(file):
+            units.setdefault(name, unit)
+    Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit=unit)
+        for name, unit in units.items()
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    tags = Tag.objects.bulk_create(
+        Tag(id=number, name=f'Тег {number}', color='#E26C2D',
+            slug=f'tag{number}')
+        for number in range(1, TAGS_COUNT + 1)
+    )
+    users = User.objects.bulk_create(
+        User(id=number, username=f'user{number}',
+             email=f'user{number}@foodgram.ru', first_name='Имя',
+             last_name='Фамилия', password='!', is_superuser=number == 1)
+        for number in range(1, USERS_COUNT + 1)
+    )
+    Token.objects.bulk_create(
+        Token(user=user, key=Token.generate_key()) for user in users)
+    Recipe.objects.bulk_create(
+        Recipe(id=number, author=rnd.choice(users), name=f'Рецепт {number}',
+               image='recipes/images/seed.png', text='Описание',
+               cooking_time=rnd.randint(1, 120))
+        for number in range(1, RECIPES_COUNT + 1)
+    )
+    recipe_ids = range(1, RECIPES_COUNT + 1)
+    Recipe.tags.through.objects.bulk_create(
+        Recipe.tags.through(recipe_id=recipe_id, tag=tag)
+        for recipe_id in recipe_ids
+        for tag in rnd.sample(tags, 2)
+    )
+    amounts, links = [], []
+    for recipe_id in recipe_ids:
+        for ingredient_id in rnd.sample(
+                ingredient_ids, INGREDIENTS_PER_RECIPE):
+            amounts.append(IngredientInRecipe(
+                id=len(amounts) + 1, ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500)))
+            links.append(Recipe.ingredients.through(
+                recipe_id=recipe_id, ingredientinrecipe_id=len(amounts)))
+    IngredientInRecipe.objects.bulk_create(amounts)
+    Recipe.ingredients.through.objects.bulk_create(links)
+    for model in (Favorite, ShoppingCart):
+        model.objects.bulk_create(
+            model(user=user, recipe_id=recipe_id)
+            for user in users
+            for recipe_id in rnd.sample(recipe_ids, 8)
+        )
+    Subscription.objects.bulk_create(
+        Subscription(user=user, author=author)
+        for user in users
+        for author in rnd.sample(users, 6)
+        if author != user
+    )
+    call_command('rebuild_shopping_cart_totals', stdout=StringIO())
+    call_command('rebuild_counters', stdout=StringIO())
+    call_command('rebuild_recipe_ranking', stdout=StringIO())
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        seed_dataset()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def single_process_cache(settings):
+    """Тесты идут в одном процессе, и кеш в его памяти общий для всех."""
+    settings.CACHE_SHARED = True
+
+
+@pytest.fixture
+def immediate_commit(monkeypatch):
+    """Действия после фиксации выполняются сразу: тест не фиксирует."""
+    monkeypatch.setattr(transaction, 'on_commit', lambda func: func())
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Изменения в тесте откатываются, поэтому кеши начинаются с нуля."""
+    cache.clear()
+
+
+@pytest.fixture
+def catalog(db):
+    """Прогретый справочник ингредиентов и тегов."""
+    return get_catalog()
+
+
+@pytest.fixture
+def ingredient_index(db):
+    """Прогретый индекс «ингредиент → рецепты»."""
+    return get_ingredient_index()
+
+
+@pytest.fixture
+def tokens(user, admin):
+    """Прогретый кеш аутентификации по токенам."""
+    for item in (user, admin):
+        CachedTokenAuthentication().authenticate_credentials(
+            item.auth_token.key)
+
+
+@pytest.fixture
+def relations(user, admin):
+    """Прогретые множества избранного, корзины и подписок."""
+    return {item.id: get_relations(item) for item in (user, admin)}
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.get(id=2)
+
+
+@pytest.fixture
+def admin(db):
+    return User.objects.get(id=1)
+
+
+def token_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token.key}')
+    return client
+
+
+@pytest.fixture
+def anon_client(db):
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    return token_client(user)
+
+
+@pytest.fixture
+def admin_client(admin):
+    return token_client(admin)
+
+
+@pytest.fixture
+def image():
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), 'orange').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+@pytest.fixture
+def bench(django_assert_max_num_queries):
+    """Выполняет запрос BENCH_ROUNDS раз, проверяя потолок запросов к БД.
+
+    Время каждого прогона попадает в сводку в конце сессии.
+    """
+    def run(name, max_queries, call):
+        response = None
+        for round_number in range(BENCH_ROUNDS):
+            with django_assert_max_num_queries(max_queries):
+                start = perf_counter()
+                response = call(round_number)
+                LATENCIES[name].append(perf_counter() - start)
+        return response
+    return run
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not LATENCIES:
+        return
+    terminalreporter.section('latency, ms')
+    terminalreporter.write_line(
+        f'{"endpoint":<44}{"n":>5}{"p50":>9}{"p95":>9}{"p99":>9}')
+    for name, values in sorted(LATENCIES.items()):
+        terminalreporter.write_line(
+            f'{name:<44}{len(values):>5}'
+            + ''.join(
+                f'{percentile(values, fraction) * 1000:>9.2f}'
+                for fraction in (0.5, 0.95, 0.99)
+            )
+        )
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from foodgram.asgi import ThreadPoolApplication, application
+
+
+def http_scope(method, path, headers=()):
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', b'testserver'), *headers],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 50000),
+    }
+
+
+async def request(app, scope, chunks=(b'',)):
+    messages = [
+        {'type': 'http.request', 'body': chunk,
+         'more_body': number < len(chunks) - 1}
+        for number, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    status = sent[0]['status']
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return status, body
+
+
+@pytest.mark.django_db
+def test_serves_django_in_thread_pool():
+    status, body = asyncio.run(
+        request(application, http_scope('GET', '/api/tags/')))
+    assert status == 200
+    assert [tag['slug'] for tag in json.loads(body)] == [
+        'tag1', 'tag2', 'tag3']
+
+
+@pytest.mark.django_db
+def test_reassembles_chunked_body():
+    payload = json.dumps(
+        {'email': 'user2@foodgram.ru', 'password': 'неверный'}).encode()
+    status, body = asyncio.run(request(
+        application,
+        http_scope('POST', '/api/auth/token/login/', [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+        ]),
+        (payload[:10], payload[10:]),
+    ))
+    assert status == 400
+    assert b'non_field_errors' in body
+
+
+class ClosingBody(list):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_runs_requests_concurrently_and_closes_responses():
+    barrier = threading.Barrier(2, timeout=5)
+    bodies = []
+
+    def wsgi(environ, start_response):
+        # Оба запроса должны одновременно оказаться в разных потоках.
+        barrier.wait()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        bodies.append(ClosingBody([environ['PATH_INFO'].encode()]))
+        return bodies[-1]
+
+    app = ThreadPoolApplication(wsgi, 2)
+
+    async def both():
+        return await asyncio.gather(
+            request(app, http_scope('GET', '/a')),
+            request(app, http_scope('GET', '/b')),
+        )
+
+    assert sorted(asyncio.run(both())) == [(200, b'/a'), (200, b'/b')]
+    assert all(body.closed for body in bodies)
+
+
+def test_lifespan():
+    app = ThreadPoolApplication(None, 1)
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
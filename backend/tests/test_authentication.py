@@ -0,0 +1,97 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from api.authentication import (TOKEN_USER_KEY, LRUCache, get_user_cache,
+                                token_digest)
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+ME = '/api/users/me/'
+
+
+def queries(call):
+    with CaptureQueriesContext(connection) as context:
+        response = call()
+    return response, len(context.captured_queries)
+
+
+def test_token_lookup_is_cached(user_client, relations):
+    assert queries(lambda: user_client.get(ME))[1] == 1
+    response, count = queries(lambda: user_client.get(ME))
+    assert response.data['username'] == 'user2'
+    assert count == 0
+
+
+def test_shared_cache_serves_other_processes(user_client, relations,
+                                             settings):
+    settings.TOKEN_AUTH_SHARED_CACHE = True
+    user_client.get(ME)
+    get_user_cache().clear()
+    assert queries(lambda: user_client.get(ME))[1] == 0
+
+
+def test_logout_revokes_cached_token(user_client, tokens, immediate_commit):
+    response = user_client.post('/api/auth/token/logout/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = user_client.get(ME)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_deactivation_revokes_cached_token(user_client, user, tokens,
+                                           immediate_commit):
+    user.is_active = False
+    user.save()
+    response = user_client.get(ME)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_password_change_keeps_counters(user_client, user, relations,
+                                        immediate_commit):
+    user.set_password('Parol-2023!')
+    user.save(update_fields=('password',))
+    user_client.get(ME)
+    # Пока пользователь в кеше, счётчик меняется запросом UPDATE.
+    User.objects.filter(id=user.id).update(recipes_count=77)
+    response = user_client.post('/api/users/set_password/', {
+        'current_password': 'Parol-2023!', 'new_password': 'Parol-2024!'})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    user.refresh_from_db()
+    assert user.check_password('Parol-2024!')
+    assert user.recipes_count == 77
+    # Сохранение пользователя сбросило запись кеша.
+    assert queries(lambda: user_client.get(ME))[1] == 1
+
+
+def test_password_is_not_cached(user_client, relations, settings):
+    settings.TOKEN_AUTH_SHARED_CACHE = True
+    user_client.get(ME)
+    digest = token_digest(user_client._credentials[
+        'HTTP_AUTHORIZATION'].split()[1])
+    for entry in (get_user_cache().get(digest),
+                  cache.get(TOKEN_USER_KEY.format(digest))):
+        assert 'password' not in entry[2]
+
+
+def test_process_local_cache_is_not_used(user_client, relations, settings):
+    settings.CACHE_SHARED = False
+    user_client.get(ME)
+    with CaptureQueriesContext(connection) as context:
+        user_client.get(ME)
+    assert [query for query in context.captured_queries
+            if 'authtoken_token' in query['sql']]
+
+
+def test_lru_evicts_oldest_and_expired():
+    cache = LRUCache(size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    expired = LRUCache(size=2, ttl=-1)
+    expired.set('a', 1)
+    assert expired.get('a') is None
@@ -0,0 +1,96 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from recipes import catalog as catalog_module
+from recipes.catalog import get_catalog
+from recipes.models import Ingredient, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def immediate_commit(monkeypatch):
+    monkeypatch.setattr(
+        catalog_module.transaction, 'on_commit', lambda func: func())
+
+
+def test_snapshot_is_reused_without_queries(catalog):
+    with CaptureQueriesContext(connection) as context:
+        assert get_catalog() is catalog
+    assert not context.captured_queries
+
+
+def test_ingredient_save_invalidates_snapshot(catalog, immediate_commit):
+    ingredient = Ingredient.objects.create(
+        name='ягоды годжи', measurement_unit='г')
+    fresh = get_catalog()
+    assert fresh is not catalog
+    assert fresh.ingredient(ingredient.id).name == 'ягоды годжи'
+
+
+def test_tag_delete_invalidates_listing(anon_client, catalog,
+                                        immediate_commit):
+    Tag.objects.filter(id=3).delete()
+    slugs = {tag['slug'] for tag in anon_client.get('/api/tags/').data}
+    assert slugs == {'tag1', 'tag2'}
+    response = anon_client.get('/api/tags/3/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_rolled_back_import_keeps_version(catalog, tmp_path):
+    path = tmp_path / 'ingredients.csv'
+    path.write_text('новый ингредиент,г\n')
+    call_command('import_ingredients', '--path', str(path), '--dry-run')
+    assert get_catalog() is catalog
+
+
+def test_search_ranks_prefix_first(catalog):
+    result = [entry.name for entry in catalog.search_ingredients('мук', 50)]
+    prefixed = [name for name in result if name.startswith('мук')]
+    assert prefixed and result[:len(prefixed)] == sorted(prefixed)
+    assert all('мук' in name for name in result)
+
+
+def test_unknown_ingredient_rejected(admin_client, image):
+    response = admin_client.post('/api/recipes/', {
+        'name': 'Рецепт',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': 10 ** 6, 'amount': 1}],
+    })
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'ingredients' in response.data
+
+
+def test_process_local_snapshot_expires(catalog, settings, monkeypatch):
+    # Ингредиент добавил другой процесс: его сброс сюда не доходит.
+    settings.CACHE_SHARED = False
+    clock = [1000.0]
+    monkeypatch.setattr(catalog_module, 'monotonic', lambda: clock[0])
+    local = get_catalog()
+    ingredient = Ingredient.objects.create(
+        name='ягоды годжи', measurement_unit='г')
+    assert get_catalog() is local
+    clock[0] += settings.LOCAL_SNAPSHOT_TIMEOUT
+    assert get_catalog().ingredient(ingredient.id) is not None
+
+
+def test_ingredient_missing_from_snapshot_is_checked_in_db(
+        admin_client, image, catalog):
+    ingredient = Ingredient.objects.create(
+        name='ягоды годжи', measurement_unit='г')
+    assert catalog.ingredient(ingredient.id) is None
+    response = admin_client.post('/api/recipes/', {
+        'name': 'Рецепт',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': ingredient.id, 'amount': 1}],
+    })
+    assert response.status_code == status.HTTP_201_CREATED, response.data
@@ -0,0 +1,97 @@
+import pytest
+from django.core.management import CommandError, call_command
+from rest_framework import status
+
+from recipes.counters import stale_counters
+from recipes.models import Recipe
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+def fresh(obj):
+    obj.refresh_from_db()
+    return obj
+
+
+def test_seed_counters_match():
+    assert stale_counters() == []
+    call_command('rebuild_counters', '--verify')
+
+
+@pytest.mark.parametrize('route, field, related', (
+    ('favorite', 'favorites_count', 'favorites'),
+    ('shopping_cart', 'in_carts_count', 'shoppingcart'),
+))
+def test_toggles_move_recipe_counters(user_client, user, route, field,
+                                      related):
+    recipe = Recipe.objects.exclude(**{f'{related}__user': user}).first()
+    before = getattr(recipe, field)
+    url = f'/api/recipes/{recipe.id}/{route}/'
+    assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    assert user_client.post(url).status_code == status.HTTP_400_BAD_REQUEST
+    assert getattr(fresh(recipe), field) == before + 1
+    assert user_client.delete(url).status_code == status.HTTP_204_NO_CONTENT
+    assert user_client.delete(url).status_code == (
+        status.HTTP_400_BAD_REQUEST)
+    assert getattr(fresh(recipe), field) == before
+
+
+def test_subscribe_moves_followers_count(user_client, user):
+    author = User.objects.exclude(id=user.id).exclude(
+        subscribed_authors__user=user).first()
+    before = author.followers_count
+    url = f'/api/users/{author.id}/subscribe/'
+    assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    assert fresh(author).followers_count == before + 1
+    assert user_client.delete(url).status_code == status.HTTP_204_NO_CONTENT
+    assert fresh(author).followers_count == before
+
+
+def test_recipe_create_and_delete_move_recipes_count(admin_client, admin,
+                                                     image):
+    before = admin.recipes_count
+    response = admin_client.post('/api/recipes/', {
+        'name': 'Новый рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': 1, 'amount': 10}],
+    })
+    assert response.status_code == status.HTTP_201_CREATED
+    assert fresh(admin).recipes_count == before + 1
+    response = admin_client.delete(f'/api/recipes/{response.data["id"]}/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert fresh(admin).recipes_count == before
+    assert stale_counters() == []
+
+
+def test_rebuild_fixes_drift():
+    Recipe.objects.filter(id=1).update(favorites_count=1000)
+    User.objects.filter(id=2).update(followers_count=1000)
+    with pytest.raises(CommandError):
+        call_command('rebuild_counters', '--verify')
+    call_command('rebuild_counters')
+    assert stale_counters() == []
+
+
+def test_most_favorited_ordering(anon_client):
+    response = anon_client.get(
+        '/api/recipes/', {'ordering': '-favorites_count', 'limit': 20})
+    assert response.status_code == status.HTTP_200_OK
+    expected = list(Recipe.objects.order_by(
+        '-favorites_count', '-id').values_list('id', flat=True)[:20])
+    assert [item['id'] for item in response.data['results']] == expected
+
+
+def test_most_favorited_cursor_pages(anon_client):
+    expected = list(Recipe.objects.order_by(
+        '-favorites_count', '-id').values_list('id', flat=True))
+    seen, params = [], {'ordering': '-favorites_count', 'cursor': ''}
+    url = '/api/recipes/'
+    while url:
+        response = anon_client.get(url, params)
+        seen += [item['id'] for item in response.data['results']]
+        url, params = response.data['next'], None
+    assert seen == expected
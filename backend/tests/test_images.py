@@ -0,0 +1,105 @@
+import base64
+import os
+from io import BytesIO, StringIO
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from PIL import Image
+from rest_framework import status
+
+from recipes import images as images_module
+from recipes.images import ImageUploadError, decode_image, render_renditions
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def immediate_commit(monkeypatch):
+    monkeypatch.setattr(
+        images_module.transaction, 'on_commit', lambda func: func())
+
+
+def data_uri(size=(64, 48), image_format='PNG', noise=False):
+    if noise:
+        image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    else:
+        image = Image.new('RGBA', size, (200, 100, 0, 128))
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    return (f'data:image/{image_format.lower()};base64,'
+            + base64.b64encode(buffer.getvalue()).decode()), buffer.getvalue()
+
+
+def recipe_payload(image):
+    return {
+        'name': 'Рецепт с картинкой',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': 1, 'amount': 10}],
+    }
+
+
+def test_decode_streams_to_disk():
+    uri, raw = data_uri((600, 400), noise=True)
+    with decode_image(uri) as upload:
+        assert upload.name.endswith('.png')
+        assert upload.size == len(raw)
+        assert upload.read() == raw
+
+
+@pytest.mark.parametrize('uri', (
+    'data:image/png;base64,не base64',
+    'data:image/png;base64,' + base64.b64encode(b'plain text').decode(),
+    'https://example.com/image.png',
+))
+def test_decode_rejects_invalid(uri):
+    with pytest.raises(ImageUploadError):
+        decode_image(uri)
+
+
+def test_decode_checks_dimensions_from_header(settings):
+    settings.RECIPE_IMAGE_MAX_PIXELS = 1000
+    with pytest.raises(ImageUploadError):
+        decode_image(data_uri((40, 40))[0])
+
+
+def test_create_rejects_broken_image(admin_client):
+    response = admin_client.post(
+        '/api/recipes/', recipe_payload('data:image/png;base64,AAAA'))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'image' in response.data
+
+
+def test_renditions_appear_in_cards(admin_client, settings,
+                                    immediate_commit):
+    settings.RECIPE_IMAGE_WORKERS = 0
+    response = admin_client.post(
+        '/api/recipes/', recipe_payload(data_uri((1200, 900))[0]))
+    assert response.status_code == status.HTTP_201_CREATED, response.data
+    assert response.data['image_renditions'] is None
+    recipe = Recipe.objects.get(id=response.data['id'])
+    render_renditions(recipe)
+    data = admin_client.get(f'/api/recipes/{recipe.id}/').data
+    card = data['image_renditions']['card']
+    assert card['webp'].startswith('http://testserver/')
+    assert card['webp'].endswith('-480-q80.webp')
+    for size, side in (('thumb', 160), ('card', 480)):
+        for extension in ('webp', 'jpeg'):
+            name = card['webp'].split(default_storage.base_url, 1)[1]
+            name = name.replace('-480-q80.webp', f'-{side}-q80.{extension}')
+            with default_storage.open(name) as file:
+                assert max(Image.open(file).size) == side
+
+
+def test_command_renders_pending_recipes(admin_client):
+    for _ in range(2):
+        admin_client.post('/api/recipes/', recipe_payload(data_uri()[0]))
+    call_command('generate_image_renditions', '--workers', '1',
+                 stdout=StringIO())
+    pending = Recipe.objects.exclude(image='recipes/images/seed.png')
+    assert all(
+        recipe.rendered_image == recipe.image.name for recipe in pending)
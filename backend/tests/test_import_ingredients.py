@@ -0,0 +1,56 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+
+def run(*args):
+    stdout = StringIO()
+    call_command('import_ingredients', *args, stdout=stdout)
+    return stdout.getvalue()
+
+
+@pytest.fixture
+def catalog_file(tmp_path):
+    path = tmp_path / 'catalog'
+    path.write_text(json.dumps([
+        {'name': f'новый ингредиент {number}', 'measurement_unit': 'г'}
+        for number in range(1500)
+    ] + [{'name': 'сыр', 'measurement_unit': 'кг'}], ensure_ascii=False))
+    return str(path)
+
+
+def test_detects_json_and_imports_in_few_queries(catalog_file):
+    before = Ingredient.objects.count()
+    with CaptureQueriesContext(connection) as context:
+        output = run('--path', catalog_file)
+    assert Ingredient.objects.count() == before + 1500
+    assert len(context.captured_queries) < 20
+    assert 'строк/с' in output
+
+
+def test_repeat_import_is_noop(catalog_file):
+    run('--path', catalog_file)
+    count = Ingredient.objects.count()
+    assert 'добавлено 0' in run('--path', catalog_file)
+    assert Ingredient.objects.count() == count
+
+
+def test_dry_run_rolls_back(catalog_file):
+    before = Ingredient.objects.count()
+    run('--path', catalog_file, '--dry-run')
+    assert Ingredient.objects.count() == before
+
+
+def test_update_refreshes_measurement_unit(catalog_file):
+    run('--path', catalog_file)
+    assert Ingredient.objects.get(name='сыр').measurement_unit == 'г'
+    run('--path', catalog_file, '--update')
+    assert Ingredient.objects.get(name='сыр').measurement_unit == 'кг'
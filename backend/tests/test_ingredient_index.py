@@ -0,0 +1,102 @@
+from collections import defaultdict
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from recipes import ingredient_index as index_module
+from recipes.ingredient_index import get_ingredient_index
+from recipes.models import Ingredient, Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def immediate_commit(monkeypatch):
+    monkeypatch.setattr(
+        index_module.transaction, 'on_commit', lambda func: func())
+
+
+def recipe_ingredients():
+    ingredients = defaultdict(set)
+    links = Recipe.ingredients.through.objects.values_list(
+        'recipe_id', 'ingredientinrecipe__ingredient_id')
+    for recipe_id, ingredient_id in links:
+        ingredients[recipe_id].add(ingredient_id)
+    return ingredients
+
+
+def pantry_of(recipe_id, size):
+    return sorted(recipe_ingredients()[recipe_id])[:size]
+
+
+def test_matches_follow_coverage():
+    pantry = set(pantry_of(1, 6)) | set(pantry_of(2, 3))
+    expected = sorted(
+        (
+            (-len(pantry & owned) / len(owned), len(owned - pantry), -pk)
+            for pk, owned in recipe_ingredients().items() if pantry & owned
+        ),
+    )
+    result = [
+        (-match.matched / match.total, match.total - match.matched,
+         -match.recipe_id)
+        for match in get_ingredient_index().match(pantry)
+    ]
+    assert result == expected
+
+
+def test_max_missing_cuts_incomplete_recipes():
+    pantry = pantry_of(1, 8)
+    matches = get_ingredient_index().match(pantry, max_missing=2)
+    assert matches[0].recipe_id == 1
+    assert all(match.total - match.matched <= 2 for match in matches)
+
+
+def test_index_is_reused_without_queries(ingredient_index):
+    with CaptureQueriesContext(connection) as context:
+        assert get_ingredient_index() is ingredient_index
+    assert not context.captured_queries
+
+
+def test_cook_endpoint(anon_client):
+    pantry = pantry_of(5, 10)
+    response = anon_client.get('/api/recipes/cook/', {
+        'ingredients': ','.join(map(str, pantry)), 'max_missing': 0})
+    assert response.status_code == status.HTTP_200_OK
+    first = response.data['results'][0]
+    assert (first['id'], first['coverage'], first['missing']) == (5, 1.0, 0)
+    assert all(item['missing'] == 0 for item in response.data['results'])
+
+
+def test_new_recipe_invalidates_index(admin_client, image, ingredient_index,
+                                      immediate_commit):
+    ingredient = Ingredient.objects.create(
+        name='ягоды асаи', measurement_unit='г')
+    response = admin_client.post('/api/recipes/', {
+        'name': 'Смузи',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': ingredient.id, 'amount': 100}],
+    })
+    assert response.status_code == status.HTTP_201_CREATED, response.data
+    assert get_ingredient_index() is not ingredient_index
+    response = admin_client.get(
+        '/api/recipes/cook/', {'ingredients': ingredient.id})
+    assert [
+        (item['name'], item['coverage'])
+        for item in response.data['results']
+    ] == [('Смузи', 1.0)]
+
+
+@pytest.mark.parametrize('params', (
+    {},
+    {'ingredients': 'молоко'},
+    {'ingredients': '1', 'max_missing': '-1'},
+))
+def test_cook_rejects_bad_params(anon_client, params):
+    response = anon_client.get('/api/recipes/cook/', params)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
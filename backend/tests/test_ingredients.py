@@ -0,0 +1,42 @@
+import pytest
+from django.db import connection
+from rest_framework import status
+
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/ingredients/'
+
+
+def names(response):
+    return [item['name'] for item in response.data]
+
+
+def test_prefix_matches_ranked_before_substring(anon_client):
+    response = anon_client.get(URL, {'name': 'Сыр', 'limit': 100})
+    assert response.status_code == status.HTTP_200_OK
+    result = names(response)
+    prefixed = [name for name in result if name.startswith('сыр')]
+    assert result[:len(prefixed)] == sorted(prefixed)
+    assert len(result) > len(prefixed)
+    assert all('сыр' in name for name in result[len(prefixed):])
+
+
+def test_limit_bounds_results(anon_client):
+    assert len(anon_client.get(URL, {'name': 'а'}).data) == 20
+    assert len(anon_client.get(URL, {'name': 'а', 'limit': 5}).data) == 5
+    response = anon_client.get(URL, {'name': 'а', 'limit': 10 ** 6})
+    assert len(response.data) == 100
+
+
+def test_list_without_name_is_not_paginated(anon_client):
+    response = anon_client.get(URL)
+    assert len(response.data) == Ingredient.objects.count()
+
+
+def test_unused_name_index_is_dropped():
+    with connection.cursor() as cursor:
+        indexes = connection.introspection.get_constraints(
+            cursor, Ingredient._meta.db_table)
+    assert 'recipes_ingredient_name_lower' not in indexes
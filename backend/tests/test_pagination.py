@@ -0,0 +1,65 @@
+import pytest
+from rest_framework import status
+
+from recipes.models import Recipe
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+def walk(client, url, params):
+    response = client.get(url, params)
+    items = list(response.data['results'])
+    while response.data['next']:
+        response = client.get(response.data['next'])
+        assert response.status_code == status.HTTP_200_OK
+        items.extend(response.data['results'])
+    return items
+
+
+def test_recipe_cursor_walks_every_recipe_once(anon_client):
+    Recipe.objects.filter(id__in=(1, 2, 3)).update(
+        pub_date=Recipe.objects.get(id=4).pub_date)
+    items = walk(anon_client, '/api/recipes/', {'cursor': '', 'limit': 7})
+    assert [item['id'] for item in items] == list(
+        Recipe.objects.order_by('-pub_date', '-id').values_list(
+            'id', flat=True))
+
+
+def test_recipe_cursor_keeps_filters(user_client, user):
+    items = walk(
+        user_client, '/api/recipes/', {'cursor': '', 'is_favorited': 1})
+    assert {item['id'] for item in items} == set(
+        user.favorite_user.values_list('recipe_id', flat=True))
+
+
+def test_user_cursor_orders_by_id(anon_client):
+    items = walk(anon_client, '/api/users/', {'cursor': '', 'limit': 4})
+    assert [item['id'] for item in items] == list(
+        User.objects.order_by('id').values_list('id', flat=True))
+
+
+@pytest.mark.parametrize('count, expected', (
+    (None, None),
+    ('none', None),
+    ('exact', 120),
+    ('estimate', 120),
+))
+def test_cursor_count_modes(anon_client, count, expected):
+    params = {'cursor': ''}
+    if count:
+        params['count'] = count
+    response = anon_client.get('/api/recipes/', params)
+    assert response.data['count'] == expected
+
+
+def test_page_number_mode_is_default(anon_client):
+    response = anon_client.get('/api/recipes/', {'page': 2})
+    assert response.data['count'] == Recipe.objects.count()
+    assert 'previous' in response.data
+
+
+@pytest.mark.parametrize('cursor', ('garbage', 'WzFd', 'eyJhIjogMX0='))
+def test_invalid_cursor(anon_client, cursor):
+    response = anon_client.get('/api/recipes/', {'cursor': cursor})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,118 @@
+import json
+import logging
+import re
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from api.performance import QueryRecorder, normalize_sql, view_stats
+
+pytestmark = pytest.mark.django_db
+
+TIMING = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries", '
+                    r'renderer;dur=[\d.]+, '
+                    r'app;dur=[\d.]+;desc="view and serializers", '
+                    r'total;dur=[\d.]+')
+
+
+@pytest.fixture(autouse=True)
+def clear_view_stats():
+    view_stats.reset()
+    yield
+    view_stats.reset()
+
+
+@pytest.fixture
+def records(caplog):
+    logger = logging.getLogger('api.performance')
+    logger.addHandler(caplog.handler)
+    yield lambda: [json.loads(record.getMessage())
+                   for record in caplog.records
+                   if record.name == 'api.performance']
+    logger.removeHandler(caplog.handler)
+
+
+def test_normalize_sql():
+    assert normalize_sql(
+        'SELECT  "a"."id" FROM "a" WHERE ("a"."id" IN (%s, %s, %s)\n'
+        " AND \"a\".\"name\" = 'it''s' AND \"a\".\"n\" > 10)"
+    ) == ('SELECT "a"."id" FROM "a" WHERE ("a"."id" IN (...) '
+          'AND "a"."name" = ? AND "a"."n" > ?)')
+    assert normalize_sql('SELECT "U0"."id" FROM "t" U0') == (
+        'SELECT "U0"."id" FROM "t" U0')
+
+
+def test_recorder_finds_repeated_query():
+    recorder = QueryRecorder()
+
+    def execute(sql, params, many, context):
+        return None
+
+    for number in range(3):
+        recorder(execute, f'SELECT * FROM "t" WHERE "id" = {number}',
+                 None, False, {})
+    recorder(execute, 'SELECT * FROM "u"', None, False, {})
+    assert recorder.count == 4
+    assert recorder.most_repeated() == (
+        'SELECT * FROM "t" WHERE "id" = ?', 3)
+
+
+def test_server_timing_counts_queries(anon_client, records):
+    with CaptureQueriesContext(connection) as queries:
+        response = anon_client.get('/api/recipes/', {'limit': 3})
+    assert response.status_code == status.HTTP_200_OK
+    timing = TIMING.fullmatch(response['Server-Timing'])
+    assert timing and int(timing.group(1)) == len(queries)
+    record, = records()
+    assert record['view'] == 'GET recipes-list'
+    assert record['status'] == 200
+    assert record['queries'] == len(queries)
+    assert record['flags'] == []
+
+
+def test_streaming_queries_are_counted(user_client, records):
+    with CaptureQueriesContext(connection) as queries:
+        response = user_client.get('/api/recipes/download_shopping_cart/')
+        assert records() == []
+        body = b''.join(response.streaming_content)
+    assert body
+    record, = records()
+    assert record['view'] == 'GET recipes-download-shopping-cart'
+    assert record['queries'] == len(queries)
+    assert any('ingredient' in query['sql'] and 'ORDER BY' in query['sql']
+               for query in queries.captured_queries[-1:])
+
+
+def test_flags_n_plus_one(anon_client, records, settings):
+    settings.PERFORMANCE_MAX_QUERIES = 1
+    anon_client.get('/api/recipes/1/')
+    record, = records()
+    assert record['queries'] >= 1
+    assert record['flags'] == ['n_plus_one']
+    assert view_stats.summary()['GET recipes-detail']['n_plus_one'] == 1
+
+
+def test_flags_slow_requests(anon_client, records, settings):
+    settings.PERFORMANCE_SLOW_REQUEST_MS = 0
+    anon_client.get('/api/tags/')
+    record, = records()
+    assert 'slow' in record['flags']
+
+
+def test_stats_are_staff_only(anon_client, user_client, admin_client):
+    for _ in range(3):
+        anon_client.get('/api/tags/')
+    assert anon_client.get('/api/performance/').status_code in (
+        status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+    assert user_client.get('/api/performance/').status_code == (
+        status.HTTP_403_FORBIDDEN)
+    response = admin_client.get('/api/performance/')
+    assert response.status_code == status.HTTP_200_OK
+    tags = response.data['GET tags-list']
+    assert tags['requests'] == 3
+    assert 0 <= tags['p50_ms'] <= tags['p95_ms'] <= tags['p99_ms']
+    assert admin_client.delete('/api/performance/').status_code == (
+        status.HTTP_204_NO_CONTENT)
+    assert 'GET tags-list' not in admin_client.get('/api/performance/').data
@@ -0,0 +1,255 @@
+"""Потолки числа SQL-запросов для каждого маршрута API.
+
+Потолок не зависит от размера страницы: возврат N+1 в сериализаторах
+ломает эти тесты, а не проходит незамеченным. Исключение — вставка
+количеств ингредиентов там, где INSERT не возвращает id (SQLite): она
+идёт по строке. Справочник, множества связей пользователей и кеш токенов
+прогреты: это состояние большинства запросов.
+"""
+import pytest
+from django.db import connection
+from rest_framework import status
+
+from recipes.models import Ingredient, Recipe
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.usefixtures('relations', 'tokens'),
+]
+
+
+def recipe_payload(image, name='Новый рецепт', amount=10, ingredients=10):
+    return {
+        'name': name,
+        'text': 'Описание',
+        'cooking_time': 15,
+        'image': image,
+        'tags': [1, 2],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id in Ingredient.objects.values_list(
+                'id', flat=True)[:ingredients]
+        ],
+    }
+
+
+def amount_inserts(ingredients):
+    """Запросы сверх одного на вставку количеств ингредиентов."""
+    if connection.features.can_return_ids_from_bulk_insert:
+        return 0
+    return ingredients - 1
+
+
+@pytest.mark.parametrize('limit', (6, 30))
+def test_recipe_list_anonymous(bench, anon_client, limit):
+    response = bench(
+        f'GET recipes?limit={limit} (anon)', 4,
+        lambda _: anon_client.get('/api/recipes/', {'limit': limit}))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == limit
+
+
+@pytest.mark.parametrize('limit', (6, 30))
+def test_recipe_list_authenticated(bench, user_client, limit):
+    response = bench(
+        f'GET recipes?limit={limit}', 4,
+        lambda _: user_client.get('/api/recipes/', {'limit': limit}))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == limit
+
+
+def test_recipe_list_cursor(bench, anon_client):
+    first = anon_client.get('/api/recipes/', {'cursor': '', 'limit': 6})
+    deep = first.data['next']
+    for _ in range(10):
+        deep = anon_client.get(deep).data['next']
+    response = bench(
+        'GET recipes?cursor= (11th page)', 3,
+        lambda _: anon_client.get(deep))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == 6
+
+
+def test_recipe_popular(bench, user_client):
+    response = bench(
+        'GET recipes/popular', 4,
+        lambda _: user_client.get('/api/recipes/popular/'))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == 6
+
+
+def test_recipe_cook(bench, user_client, ingredient_index):
+    ingredient_ids = Ingredient.objects.values_list('id', flat=True)[:20]
+    response = bench(
+        'GET recipes/cook', 4,
+        lambda _: user_client.get('/api/recipes/cook/', {
+            'ingredients': ','.join(map(str, ingredient_ids))}))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == 6
+
+
+def test_recipe_list_authenticated_warm_payloads(bench, user_client):
+    user_client.get('/api/recipes/', {'limit': 30})
+    response = bench(
+        'GET recipes?limit=30 (cached cards)', 2,
+        lambda _: user_client.get('/api/recipes/', {'limit': 30}))
+    assert len(response.data['results']) == 30
+
+
+@pytest.mark.parametrize('params', (
+    {'tags': ['tag1', 'tag2']},
+    {'author': 3},
+    {'is_favorited': 1},
+    {'is_in_shopping_cart': 1},
+    {'search': 'масло сливочное'},
+))
+def test_recipe_list_filters(bench, user_client, params):
+    name = 'GET recipes?' + '&'.join(params)
+    response = bench(
+        name, 5, lambda _: user_client.get('/api/recipes/', params))
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_recipe_list_is_favorited_filter(user_client, user):
+    response = user_client.get(
+        '/api/recipes/', {'is_favorited': 1, 'limit': 100})
+    favorited = set(user.favorite_user.values_list('recipe_id', flat=True))
+    assert {item['id'] for item in response.data['results']} == favorited
+    assert all(item['is_favorited'] for item in response.data['results'])
+
+
+def test_recipe_detail(bench, user_client):
+    response = bench(
+        'GET recipes/{id}', 3, lambda _: user_client.get('/api/recipes/1/'))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['ingredients']) == 10
+
+
+@pytest.mark.parametrize('ingredients', (10, 30))
+def test_recipe_create(bench, admin_client, image, ingredients):
+    payload = recipe_payload(image, ingredients=ingredients)
+    response = bench(
+        f'POST recipes ({ingredients} ingredients)',
+        16 + amount_inserts(ingredients),
+        lambda _: admin_client.post('/api/recipes/', payload))
+    assert response.status_code == status.HTTP_201_CREATED, response.data
+
+
+def test_recipe_update(bench, admin_client, image):
+    recipe_id = Recipe.objects.filter(author_id=1).values_list(
+        'id', flat=True).first()
+    response = bench(
+        'PATCH recipes/{id}', 29 + amount_inserts(10),
+        lambda round_number: admin_client.patch(
+            f'/api/recipes/{recipe_id}/',
+            recipe_payload(image, amount=round_number + 1)))
+    assert response.status_code == status.HTTP_200_OK, response.data
+
+
+def test_recipe_delete(bench, admin_client):
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True)[:5])
+    bench(
+        'DELETE recipes/{id}', 16,
+        lambda round_number: admin_client.delete(
+            f'/api/recipes/{recipe_ids[round_number % 5]}/'))
+
+
+@pytest.mark.parametrize('route, max_queries', (
+    ('favorite', 11),
+    ('shopping_cart', 17),
+))
+def test_recipe_toggles(bench, user_client, user, route, max_queries):
+    recipe = Recipe.objects.exclude(favorites__user=user).exclude(
+        shoppingcart__user=user).first()
+    url = f'/api/recipes/{recipe.id}/{route}/'
+
+    def toggle(round_number):
+        response = user_client.post(url)
+        assert response.status_code == status.HTTP_201_CREATED
+        response = user_client.post(url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = user_client.delete(url)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        return user_client.delete(url)
+
+    response = bench(
+        f'POST+DELETE recipes/{{id}}/{route} x2', max_queries, toggle)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_download_shopping_cart(bench, user_client):
+    response = bench(
+        'GET recipes/download_shopping_cart', 2,
+        lambda _: user_client.get('/api/recipes/download_shopping_cart/'))
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.parametrize('limit', (6, 30))
+def test_user_list(bench, user_client, limit):
+    response = bench(
+        f'GET users?limit={limit}', 2,
+        lambda _: user_client.get('/api/users/', {'limit': limit}))
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == limit
+
+
+def test_user_detail(bench, user_client):
+    response = bench(
+        'GET users/{id}', 1, lambda _: user_client.get('/api/users/3/'))
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_user_me(bench, user_client):
+    response = bench(
+        'GET users/me', 0, lambda _: user_client.get('/api/users/me/'))
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.parametrize('params', ({}, {'recipes_limit': 3}))
+def test_subscriptions(bench, user_client, params):
+    name = 'GET users/subscriptions?' + '&'.join(params)
+    response = bench(
+        name, 3,
+        lambda _: user_client.get('/api/users/subscriptions/', params))
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_subscribe_toggle(bench, user_client, user):
+    author_id = user.subscribers.values_list(
+        'author_id', flat=True).first()
+    url = f'/api/users/{author_id}/subscribe/'
+
+    def toggle(round_number):
+        response = user_client.delete(url)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        return user_client.post(url)
+
+    response = bench('DELETE+POST users/{id}/subscribe', 6, toggle)
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+def test_tag_list(bench, anon_client, catalog):
+    response = bench('GET tags', 0, lambda _: anon_client.get('/api/tags/'))
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_tag_detail(bench, anon_client, catalog):
+    response = bench(
+        'GET tags/{id}', 0, lambda _: anon_client.get('/api/tags/1/'))
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_ingredient_search(bench, anon_client, catalog):
+    response = bench(
+        'GET ingredients?name=', 0,
+        lambda _: anon_client.get('/api/ingredients/', {'name': 'сыр'}))
+    assert response.status_code == status.HTTP_200_OK
+    assert 0 < len(response.data) <= 20
+
+
+def test_ingredient_detail(bench, anon_client, catalog):
+    ingredient_id = Ingredient.objects.values_list('id', flat=True).first()
+    response = bench(
+        'GET ingredients/{id}', 0,
+        lambda _: anon_client.get(f'/api/ingredients/{ingredient_id}/'))
+    assert response.status_code == status.HTTP_200_OK
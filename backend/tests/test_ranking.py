@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework import status
+
+from recipes.models import (RANKED_MODELS, Favorite, Recipe, RecipeRank,
+                            RecipeRankEpoch, ShoppingCart)
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/popular/'
+
+
+def scores():
+    return dict(RecipeRank.objects.values_list('recipe_id', 'score'))
+
+
+def min_score():
+    return RecipeRankEpoch.objects.annotate(
+        threshold=RecipeRank.objects.min_score()).get().threshold
+
+
+def assert_scores_match(expected):
+    stored = scores()
+    assert set(stored) >= set(expected)
+    for recipe_id, score in stored.items():
+        assert score == pytest.approx(
+            expected.get(recipe_id, 0), rel=1e-9, abs=min_score() / 1000)
+
+
+def expected_ids():
+    return [
+        recipe_id for recipe_id, _ in sorted(
+            RecipeRank.objects.calculate().items(),
+            key=lambda item: (-item[1], -item[0]),
+        )
+    ]
+
+
+def test_popular_follows_ranking(anon_client):
+    response = anon_client.get(URL, {'limit': 200})
+    assert response.status_code == status.HTTP_200_OK
+    ids = [item['id'] for item in response.data['results']]
+    assert ids == expected_ids()
+    assert anon_client.get(
+        '/api/recipes/', {'ordering': 'popular', 'limit': 200}
+    ).data['results'] == response.data['results']
+
+
+def test_popular_cursor_pages(anon_client):
+    seen, url, params = [], URL, {'cursor': '', 'limit': 7}
+    while url:
+        response = anon_client.get(url, params)
+        seen += [item['id'] for item in response.data['results']]
+        url, params = response.data['next'], None
+    assert seen == expected_ids()
+
+
+@pytest.mark.parametrize('route', ('favorite', 'shopping_cart'))
+def test_toggles_update_ranking_incrementally(user_client, user, route):
+    recipe = Recipe.objects.exclude(favorites__user=user).exclude(
+        shoppingcart__user=user).first()
+    url = f'/api/recipes/{recipe.id}/{route}/'
+    before = scores()
+    assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    assert scores()[recipe.id] > before.get(recipe.id, 0)
+    assert_scores_match(RecipeRank.objects.calculate())
+    assert user_client.delete(url).status_code == status.HTTP_204_NO_CONTENT
+    assert_scores_match(before)
+
+
+def test_event_weight_halves_each_half_life(settings):
+    now = timezone.now()
+    epoch = RecipeRankEpoch.objects.get().epoch
+    half_life = timedelta(days=settings.RECIPE_RANK_HALF_LIFE_DAYS)
+    assert RecipeRank.objects.weight_at(now, epoch) == pytest.approx(
+        2 * RecipeRank.objects.weight_at(now - half_life, epoch))
+
+
+def test_stale_epoch_is_moved_forward(user_client, user, settings):
+    # Рейтинг пересчитан 300 периодов назад: вес нового события вышел бы
+    # за предел, поэтому суммы уменьшаются и точка переносится.
+    settings.RECIPE_RANK_HALF_LIFE_DAYS = 0.5
+    RecipeRank.objects.rebuild(now=timezone.now() - timedelta(days=150))
+    recipe = Recipe.objects.exclude(favorites__user=user).first()
+    url = f'/api/recipes/{recipe.id}/favorite/'
+    assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    assert RecipeRankEpoch.objects.get().epoch == pytest.approx(
+        timezone.now().timestamp(), abs=60)
+    assert_scores_match(RecipeRank.objects.calculate(
+        now=timezone.now() - timedelta(days=150)))
+
+
+@pytest.mark.parametrize('half_life_days', (0.5, 0.01))
+def test_short_half_life_does_not_overflow(user_client, user, settings,
+                                           half_life_days):
+    # Рейтинг посчитан от прежней постоянной точки 2024 года.
+    settings.RECIPE_RANK_HALF_LIFE_DAYS = half_life_days
+    RecipeRankEpoch.objects.update(epoch=1704067200.0)
+    recipe = Recipe.objects.exclude(favorites__user=user).first()
+    url = f'/api/recipes/{recipe.id}/favorite/'
+    assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    assert user_client.delete(url).status_code == status.HTTP_204_NO_CONTENT
+    call_command('rebuild_recipe_ranking')
+    assert_scores_match(RecipeRank.objects.calculate())
+
+
+def test_rebuild_moves_epoch():
+    RecipeRankEpoch.objects.update(epoch=0)
+    call_command('rebuild_recipe_ranking')
+    assert RecipeRankEpoch.objects.get().epoch == pytest.approx(
+        timezone.now().timestamp(), abs=60)
+    assert max(scores().values()) <= 2 * len(RANKED_MODELS) * 30
+
+
+def test_events_outside_window_are_dropped():
+    ShoppingCart.objects.update(
+        created=timezone.now() - timedelta(days=365))
+    Favorite.objects.update(created=timezone.now() - timedelta(days=365))
+    call_command('rebuild_recipe_ranking')
+    assert not RecipeRank.objects.exists()
@@ -0,0 +1,114 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from recipes.models import IngredientInRecipe, Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+def payload(recipe, image, amounts):
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': image,
+        'tags': list(recipe.tags.values_list('id', flat=True)),
+        'ingredients': [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in amounts.items()
+        ],
+    }
+
+
+def current_rows(recipe):
+    return {
+        row.ingredient_id: (row.pk, row.amount)
+        for row in recipe.ingredients.all()
+    }
+
+
+@pytest.fixture
+def recipe(admin):
+    return Recipe.objects.filter(author=admin).first()
+
+
+def test_changing_one_amount_touches_one_row(admin_client, recipe, image):
+    before = current_rows(recipe)
+    amounts = {ingredient_id: amount
+               for ingredient_id, (_, amount) in before.items()}
+    changed_id = next(iter(amounts))
+    amounts[changed_id] += 5
+    with CaptureQueriesContext(connection) as queries:
+        response = admin_client.patch(
+            f'/api/recipes/{recipe.id}/', payload(recipe, image, amounts))
+    assert response.status_code == status.HTTP_200_OK, response.data
+    writes = [
+        query['sql'] for query in queries.captured_queries
+        if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        and 'recipes_ingredientinrecipe' in query['sql']
+    ]
+    assert len(writes) == 1
+    assert writes[0].startswith('UPDATE')
+    after = current_rows(recipe)
+    assert {key: pk for key, (pk, _) in after.items()} == {
+        key: pk for key, (pk, _) in before.items()}
+    assert after[changed_id][1] == amounts[changed_id]
+
+
+def test_removed_ingredients_are_deleted(admin_client, recipe, image):
+    before = current_rows(recipe)
+    kept = dict(list(
+        (ingredient_id, amount)
+        for ingredient_id, (_, amount) in before.items())[:3])
+    response = admin_client.patch(
+        f'/api/recipes/{recipe.id}/', payload(recipe, image, kept))
+    assert response.status_code == status.HTTP_200_OK, response.data
+    assert set(current_rows(recipe)) == set(kept)
+    assert not IngredientInRecipe.objects.orphans().exists()
+    assert not IngredientInRecipe.objects.filter(pk__in=[
+        pk for ingredient_id, (pk, _) in before.items()
+        if ingredient_id not in kept
+    ]).exists()
+
+
+def test_update_keeps_shopping_cart_totals(admin_client, recipe, image):
+    amounts = {ingredient_id: amount + 1
+               for ingredient_id, (_, amount) in current_rows(recipe).items()}
+    amounts.popitem()
+    admin_client.patch(
+        f'/api/recipes/{recipe.id}/', payload(recipe, image, amounts))
+    call_command('rebuild_shopping_cart_totals', '--verify')
+
+
+def test_delete_removes_ingredient_rows(admin_client, recipe):
+    pks = [pk for pk, _ in current_rows(recipe).values()]
+    response = admin_client.delete(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert not IngredientInRecipe.objects.filter(pk__in=pks).exists()
+
+
+def test_purge_orphan_ingredients(recipe):
+    orphans = IngredientInRecipe.objects.bulk_create(
+        IngredientInRecipe(ingredient_id=1, amount=1) for _ in range(3))
+    rows = recipe.ingredients.count()
+    call_command('purge_orphan_ingredients', '--dry-run')
+    assert IngredientInRecipe.objects.orphans().count() == len(orphans)
+    call_command('purge_orphan_ingredients')
+    assert not IngredientInRecipe.objects.orphans().exists()
+    assert recipe.ingredients.count() == rows
+
+
+def test_delete_orphans_sends_no_signals(recipe, monkeypatch):
+    orphan = IngredientInRecipe.objects.create(ingredient_id=1, amount=1)
+    linked = recipe.ingredients.first()
+    deleted = []
+    monkeypatch.setattr(
+        'api.signals.bump_generation', lambda name: deleted.append(name))
+    assert IngredientInRecipe.objects.filter(
+        pk__in=(orphan.pk, linked.pk)).delete_orphans() == 1
+    assert deleted == []
+    assert list(IngredientInRecipe.objects.filter(
+        pk__in=(orphan.pk, linked.pk))) == [linked]
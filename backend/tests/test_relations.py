@@ -0,0 +1,122 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from recipes.models import Favorite, Recipe
+from recipes.relations import (bump_relation, get_relations, relations_key,
+                               version_key)
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+
+def relation_queries(queries):
+    return [
+        query['sql'] for query in queries.captured_queries
+        if any(table in query['sql'] for table in (
+            'recipes_favorite', 'recipes_shoppingcart', 'users_subscription'))
+    ]
+
+
+def test_sets_match_database(user):
+    relations = get_relations(user)
+    assert relations['favorites'] == set(
+        user.favorite_user.values_list('recipe_id', flat=True))
+    assert relations['shopping_cart'] == set(
+        user.shoppingcart.values_list('recipe_id', flat=True))
+    assert relations['subscriptions'] == set(
+        user.subscribers.values_list('author_id', flat=True))
+
+
+@pytest.mark.parametrize('params', (
+    {},
+    {'is_favorited': 1},
+    {'is_in_shopping_cart': 1},
+))
+def test_reads_resolve_from_memory(user_client, relations, params):
+    user_client.get('/api/recipes/', params)
+    with CaptureQueriesContext(connection) as queries:
+        response = user_client.get('/api/recipes/', params)
+    assert response.status_code == status.HTTP_200_OK
+    assert not relation_queries(queries)
+
+
+def test_filter_is_favorited_uses_cached_ids(user_client, user, relations):
+    response = user_client.get(
+        '/api/recipes/', {'is_favorited': 1, 'limit': 100})
+    assert {item['id'] for item in response.data['results']} == set(
+        relations[user.id]['favorites'])
+
+
+def test_toggles_invalidate_sets(user_client, user, relations,
+                                 immediate_commit):
+    recipe_id = Recipe.objects.exclude(
+        id__in=relations[user.id]['favorites']).values_list(
+        'id', flat=True).first()
+    url = f'/api/recipes/{recipe_id}/favorite/'
+    assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    assert recipe_id in get_relations(user)['favorites']
+    card = user_client.get(f'/api/recipes/{recipe_id}/').data
+    assert card['is_favorited'] is True
+    assert user_client.delete(url).status_code == status.HTTP_204_NO_CONTENT
+    assert recipe_id not in get_relations(user)['favorites']
+
+
+def test_stale_set_is_fixed_on_conflict(user_client, user, relations,
+                                        immediate_commit):
+    recipe_id = Recipe.objects.exclude(
+        id__in=relations[user.id]['favorites']).values_list(
+        'id', flat=True).first()
+    Favorite.objects.create(user=user, recipe_id=recipe_id)
+    url = f'/api/recipes/{recipe_id}/favorite/'
+    assert user_client.post(url).status_code == status.HTTP_400_BAD_REQUEST
+    assert recipe_id in get_relations(user)['favorites']
+
+
+def test_stale_set_is_fixed_on_missing_row(user_client, user, relations,
+                                           immediate_commit):
+    recipe_id = next(iter(relations[user.id]['favorites']))
+    Favorite.objects.filter(user=user, recipe_id=recipe_id).delete()
+    url = f'/api/recipes/{recipe_id}/favorite/'
+    assert user_client.delete(url).status_code == (
+        status.HTTP_400_BAD_REQUEST)
+    assert recipe_id not in get_relations(user)['favorites']
+
+
+def test_subscribe_invalidates_set(user_client, user, relations,
+                                   immediate_commit):
+    author_id = next(iter(relations[user.id]['subscriptions']))
+    url = f'/api/users/{author_id}/subscribe/'
+    assert user_client.delete(url).status_code == status.HTTP_204_NO_CONTENT
+    assert author_id not in get_relations(user)['subscriptions']
+    assert user_client.get(f'/api/users/{author_id}/').data[
+        'is_subscribed'] is False
+    assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    assert author_id in get_relations(user)['subscriptions']
+    assert Subscription.objects.filter(
+        user=user, author_id=author_id).exists()
+
+
+def test_late_loader_does_not_restore_stale_set(
+        user, relations, immediate_commit):
+    # Запрос прочитал версию и старое множество до переключения, а
+    # записал его в кеш уже после.
+    version = cache.get(version_key(user.id, 'favorites'))
+    stale = relations[user.id]['favorites']
+    recipe_id = Recipe.objects.exclude(id__in=stale).values_list(
+        'id', flat=True).first()
+    Favorite.objects.create(user=user, recipe_id=recipe_id)
+    bump_relation(user.id, 'favorites')
+    cache.set(relations_key(user.id, 'favorites'), (version, stale))
+    assert recipe_id in get_relations(user)['favorites']
+
+
+def test_process_local_cache_is_bypassed(user, relations, settings):
+    settings.CACHE_SHARED = False
+    recipe_id = Recipe.objects.exclude(
+        id__in=relations[user.id]['favorites']).values_list(
+        'id', flat=True).first()
+    Favorite.objects.create(user=user, recipe_id=recipe_id)
+    assert recipe_id in get_relations(user)['favorites']
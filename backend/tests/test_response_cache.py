@@ -0,0 +1,192 @@
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from rest_framework import status
+
+from api import response_cache
+from api.recipes_serializers import RecipeReadSerializer
+from recipes.models import Recipe, Tag
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture
+def immediate_commit(monkeypatch):
+    monkeypatch.setattr(
+        response_cache.transaction, 'on_commit', lambda func: func())
+
+
+def test_second_anonymous_request_is_a_hit(anon_client):
+    first = anon_client.get(URL, {'limit': 3})
+    second = anon_client.get(URL, {'limit': 3})
+    assert first['X-Cache'] == 'MISS'
+    assert second['X-Cache'] == 'HIT'
+    assert second.data == first.data
+    assert response_cache.get_stats() == {'hits': 1, 'misses': 1}
+
+
+def test_hit_runs_no_queries(bench, anon_client):
+    anon_client.get('/api/recipes/1/')
+    response = bench(
+        'GET recipes/{id} (anon, cached)', 0,
+        lambda _: anon_client.get('/api/recipes/1/'))
+    assert response.status_code == status.HTTP_200_OK
+    assert response['X-Cache'] == 'HIT'
+
+
+def test_query_string_is_normalized(anon_client):
+    anon_client.get(URL + '?tags=tag2&limit=3&tags=tag1')
+    response = anon_client.get(URL + '?limit=3&tags=tag1&tags=tag2')
+    assert response['X-Cache'] == 'HIT'
+
+
+def test_authenticated_requests_bypass_cache(user_client):
+    user_client.get(URL)
+    response = user_client.get(URL)
+    assert 'X-Cache' not in response
+    assert response_cache.get_stats() == {'hits': 0, 'misses': 0}
+
+
+@pytest.mark.parametrize('client_name', ('anon_client', 'user_client'))
+def test_process_local_cache_is_bypassed(request, settings, client_name):
+    # Рецепт изменил другой процесс: его сброс сюда не доходит.
+    settings.CACHE_SHARED = False
+    client = request.getfixturevalue(client_name)
+    client.get('/api/recipes/1/')
+    Recipe.objects.filter(id=1).update(name='Переименован')
+    response = client.get('/api/recipes/1/')
+    assert 'X-Cache' not in response
+    assert response.data['name'] == 'Переименован'
+    assert response_cache.get_stats() == {'hits': 0, 'misses': 0}
+
+
+def test_errors_are_not_cached(anon_client):
+    anon_client.get('/api/recipes/100500/')
+    response = anon_client.get('/api/recipes/100500/')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response_cache.get_stats() == {'hits': 0, 'misses': 2}
+
+
+@pytest.mark.parametrize('change', (
+    lambda: Recipe.objects.get(id=1).save(),
+    lambda: Tag.objects.get(id=1).save(),
+    lambda: User.objects.get(id=3).save(),
+))
+def test_model_changes_invalidate(anon_client, immediate_commit, change):
+    anon_client.get(URL)
+    change()
+    assert anon_client.get(URL)['X-Cache'] == 'MISS'
+
+
+def test_recipe_update_shows_up_for_anonymous(admin_client, anon_client,
+                                              image, immediate_commit):
+    anon_client.get('/api/recipes/1/')
+    recipe = Recipe.objects.get(id=1)
+    admin_client.patch('/api/recipes/1/', {
+        'name': 'Обновлённый рецепт',
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': 1, 'amount': 5}],
+    })
+    response = anon_client.get('/api/recipes/1/')
+    assert response['X-Cache'] == 'MISS'
+    assert response.data['name'] == 'Обновлённый рецепт'
+
+
+def test_evicted_generation_starts_fresh(anon_client):
+    anon_client.get(URL)
+    before = response_cache.get_generations()
+    cache.delete(response_cache.GENERATION_KEY.format('recipe'))
+    assert response_cache.get_generations() != before
+    assert anon_client.get(URL)['X-Cache'] == 'MISS'
+
+
+def test_stats_command(anon_client):
+    anon_client.get(URL)
+    anon_client.get(URL)
+    out = StringIO()
+    call_command('response_cache_stats', '--reset', stdout=out)
+    assert 'Попаданий: 1, промахов: 1' in out.getvalue()
+    assert response_cache.get_stats() == {'hits': 0, 'misses': 0}
+
+
+def test_cards_share_public_part_between_users(user_client, admin_client,
+                                               user):
+    favorite_id = user.favorite_user.values_list(
+        'recipe_id', flat=True).first()
+    url = f'/api/recipes/{favorite_id}/'
+    admin_card = admin_client.get(url).data
+    user_card = user_client.get(url).data
+    assert user_card['is_favorited'] is True
+    assert admin_card['is_favorited'] == Recipe.objects.filter(
+        id=favorite_id, favorites__user_id=1).exists()
+    for name in ('name', 'tags', 'ingredients', 'image', 'text'):
+        assert user_card[name] == admin_card[name]
+    assert list(user_card) == list(admin_card)
+    assert list(user_card['author'])[-1] == 'is_subscribed'
+
+
+def test_cached_cards_match_fresh_ones(user_client, user):
+    response = user_client.get('/api/recipes/', {'limit': 10})
+    request = response.wsgi_request
+    request.user = user
+    recipes = Recipe.objects.select_related('author')
+    for item in response.data['results']:
+        recipe = recipes.get(id=item['id'])
+        cache.clear()
+        expected = RecipeReadSerializer(
+            recipe, context={'request': request}).data
+        assert item == expected
+
+
+def test_recipe_change_refreshes_card(user_client, immediate_commit):
+    user_client.get('/api/recipes/1/')
+    Recipe.objects.filter(id=1).update(name='Переименован')
+    assert user_client.get('/api/recipes/1/').data['name'] != 'Переименован'
+    Recipe.objects.get(id=1).save()
+    assert user_client.get('/api/recipes/1/').data['name'] == 'Переименован'
+
+
+def test_author_change_refreshes_card(user_client, immediate_commit):
+    author = Recipe.objects.get(id=1).author
+    user_client.get('/api/recipes/1/')
+    author.first_name = 'Новое имя'
+    author.save()
+    card = user_client.get('/api/recipes/1/').data
+    assert card['author']['first_name'] == 'Новое имя'
+
+
+def test_deleted_amount_refreshes_card(user_client, immediate_commit):
+    user_client.get('/api/recipes/1/')
+    amount = Recipe.objects.get(id=1).ingredients.first()
+    amount_id = amount.id
+    amount.delete()
+    card = user_client.get('/api/recipes/1/').data
+    assert amount_id not in {item['id'] for item in card['ingredients']}
+
+
+def test_imported_unit_refreshes_card(user_client, immediate_commit,
+                                      tmp_path):
+    card = user_client.get('/api/recipes/1/').data
+    ingredient = card['ingredients'][0]
+    path = tmp_path / 'ingredients.csv'
+    path.write_text(f'{ingredient["name"]},новая единица\n',
+                    encoding='UTF-8')
+    call_command('import_ingredients', '--path', str(path), '--update',
+                 stdout=StringIO())
+    card = user_client.get('/api/recipes/1/').data
+    assert card['ingredients'][0]['measurement_unit'] == 'новая единица'
+
+
+def test_login_keeps_cached_responses(anon_client, immediate_commit):
+    anon_client.get(URL)
+    user = User.objects.get(id=3)
+    user.save(update_fields=('last_login',))
+    assert anon_client.get(URL)['X-Cache'] == 'HIT'
@@ -0,0 +1,103 @@
+import pytest
+from rest_framework import status
+
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/'
+
+
+def search(client, query, **params):
+    response = client.get(URL, {'search': query, 'limit': 50, **params})
+    assert response.status_code == status.HTTP_200_OK
+    return [item['id'] for item in response.data['results']]
+
+
+@pytest.fixture
+def ingredient():
+    return Ingredient.objects.filter(name__regex=r'^\w+$').order_by(
+        'id').first()
+
+
+@pytest.fixture
+def create_recipe(admin_client, image, ingredient):
+    def create(name, text, ingredient_id=None):
+        response = admin_client.post(URL, {
+            'name': name,
+            'text': text,
+            'cooking_time': 30,
+            'image': image,
+            'tags': [1],
+            'ingredients': [
+                {'id': ingredient_id or ingredient.id, 'amount': 100}],
+        })
+        assert response.status_code == status.HTTP_201_CREATED
+        return response.data['id']
+    return create
+
+
+def test_search_covers_name_text_and_ingredients(anon_client, create_recipe,
+                                                 ingredient):
+    recipe_id = create_recipe('Борщ тыквенный', 'Наваристый, с кукумбрией')
+    assert search(anon_client, 'тыквенный') == [recipe_id]
+    assert search(anon_client, 'КУКУМБР') == [recipe_id]
+    assert search(anon_client, 'борщ наваристый') == [recipe_id]
+    assert search(anon_client, 'борщ зюзюблик') == []
+    assert recipe_id in search(anon_client, ingredient.name)
+
+
+def test_name_match_ranks_above_text_match(anon_client, create_recipe):
+    in_text = create_recipe('Пирог с фрыкаделями', 'Почти как бублимир')
+    in_name = create_recipe('Бублимир', 'Фрукты, мука, яйца')
+    assert search(anon_client, 'бублимир') == [in_name, in_text]
+
+
+def test_index_follows_updates_and_deletes(admin_client, anon_client,
+                                           create_recipe, image):
+    recipe_id = create_recipe('Тыдыщ', 'Сборная мясная')
+    other = Ingredient.objects.filter(name__regex=r'^\w+$').order_by(
+        '-id').first()
+    response = admin_client.patch(f'{URL}{recipe_id}/', {
+        'name': 'Шмякса',
+        'text': 'На бруснике',
+        'cooking_time': 15,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': other.id, 'amount': 50}],
+    })
+    assert response.status_code == status.HTTP_200_OK
+    assert search(anon_client, 'тыдыщ') == []
+    assert search(anon_client, 'шмякса брусник') == [recipe_id]
+    assert recipe_id in search(anon_client, other.name)
+    admin_client.delete(f'{URL}{recipe_id}/')
+    assert search(anon_client, 'шмякса') == []
+
+
+def test_ingredient_rename_reindexes_recipes(anon_client, create_recipe,
+                                             ingredient):
+    recipe_id = create_recipe('Салат', 'Простой')
+    Ingredient.objects.filter(id=ingredient.id).update(name='Квакамоле')
+    assert recipe_id in search(anon_client, 'квакамоле')
+
+
+def test_search_without_words_is_empty(anon_client):
+    assert search(anon_client, '!!! ---') == []
+
+
+def test_search_pages_by_relevance(anon_client, create_recipe):
+    ids = [create_recipe(f'Кашамала {number}', 'Рецепт') for number in
+           range(3)]
+    response = anon_client.get(
+        URL, {'search': 'кашамала', 'limit': 2, 'cursor': ''})
+    assert response.data['count'] == 3
+    assert len(response.data['results']) == 2
+    second = anon_client.get(response.data['next']).data['results']
+    found = [item['id'] for item in response.data['results'] + second]
+    assert sorted(found) == sorted(ids)
+
+
+def test_search_combines_with_filters(anon_client, create_recipe):
+    recipe_id = create_recipe('Пловундра', 'С бараниной')
+    assert search(anon_client, 'пловундра', tags='tag1') == [recipe_id]
+    assert search(anon_client, 'пловундра', tags='tag2') == []
@@ -0,0 +1,170 @@
+import csv
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F, Sum
+from rest_framework import status
+
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCartTotal)
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+def expected_totals(user):
+    return {
+        (name, unit): amount
+        for name, unit, amount in IngredientInRecipe.objects.filter(
+            recipes__shoppingcart__user=user
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).annotate(total=Sum('amount'))
+    }
+
+
+def content(response):
+    return b''.join(response.streaming_content).decode()
+
+
+def test_text_is_default_and_line_separated(user_client, user):
+    response = user_client.get(URL)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['Content-Type'].startswith('text/plain')
+    lines = content(response).splitlines()
+    assert lines[0] == 'Список покупок:'
+    assert len(lines) == len(expected_totals(user)) + 1
+
+
+@pytest.mark.parametrize('params, headers', (
+    ({'format': 'csv'}, {}),
+    ({}, {'HTTP_ACCEPT': 'text/csv'}),
+))
+def test_csv_sums_amounts_per_ingredient(user_client, user, params, headers):
+    response = user_client.get(URL, params, **headers)
+    assert response['Content-Type'].startswith('text/csv')
+    rows = list(csv.DictReader(StringIO(content(response))))
+    assert {
+        (row['name'], row['measurement_unit']): int(row['amount'])
+        for row in rows
+    } == expected_totals(user)
+
+
+def test_json(user_client, user):
+    response = user_client.get(URL, {'format': 'json'})
+    assert response['Content-Type'].startswith('application/json')
+    items = json.loads(content(response))
+    assert {
+        (item['name'], item['measurement_unit']): item['amount']
+        for item in items
+    } == expected_totals(user)
+
+
+def test_empty_cart_json(user_client, user):
+    for recipe_id in user.shoppingcart.values_list('recipe_id', flat=True):
+        user_client.delete(f'/api/recipes/{recipe_id}/shopping_cart/')
+    response = user_client.get(URL, {'format': 'json'})
+    assert json.loads(content(response)) == []
+
+
+def test_repeat_download_not_modified(user_client, user):
+    etag = user_client.get(URL)['ETag']
+    response = user_client.get(URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert user_client.get(URL, {'format': 'csv'})['ETag'] != etag
+    recipe_id = user.shoppingcart.values_list('recipe_id', flat=True)[0]
+    user_client.delete(f'/api/recipes/{recipe_id}/shopping_cart/')
+    response = user_client.get(URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_etag_changes_when_amounts_move(user_client, user):
+    # Сумма количеств и число строк те же, меняется их распределение.
+    etag = user_client.get(URL)['ETag']
+    totals = ShoppingCartTotal.objects.filter(user=user)
+    donor = totals.filter(amount__gt=1).first()
+    receiver = totals.exclude(id=donor.id).first()
+    totals.filter(id=donor.id).update(amount=F('amount') - 1)
+    totals.filter(id=receiver.id).update(amount=F('amount') + 1)
+    response = user_client.get(URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+
+def test_anonymous_forbidden(anon_client):
+    response = anon_client.get(URL)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def verify_totals():
+    call_command('rebuild_shopping_cart_totals', '--verify', stdout=StringIO())
+
+
+def test_totals_follow_cart_toggles(user_client, user):
+    recipe = Recipe.objects.exclude(shoppingcart__user=user).first()
+    url = f'/api/recipes/{recipe.id}/shopping_cart/'
+    user_client.post(url)
+    verify_totals()
+    user_client.delete(url)
+    verify_totals()
+
+
+def test_totals_follow_recipe_update(admin_client, image):
+    recipe = Recipe.objects.filter(
+        author_id=1, shoppingcart__isnull=False).first()
+    ingredients = [
+        {'id': ingredient_id, 'amount': amount + 7}
+        for ingredient_id, amount in recipe.ingredients.values_list(
+            'ingredient_id', 'amount')[1:]
+    ]
+    response = admin_client.patch(f'/api/recipes/{recipe.id}/', {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': image,
+        'tags': [1],
+        'ingredients': ingredients,
+    })
+    assert response.status_code == status.HTTP_200_OK, response.data
+    verify_totals()
+
+
+def test_totals_follow_recipe_delete(admin_client):
+    recipe = Recipe.objects.filter(
+        author_id=1, shoppingcart__isnull=False).first()
+    admin_client.delete(f'/api/recipes/{recipe.id}/')
+    verify_totals()
+
+
+def test_verify_detects_drift_and_rebuild_fixes_it(user):
+    user.shopping_cart_totals.filter(
+        id=user.shopping_cart_totals.first().id).delete()
+    with pytest.raises(CommandError):
+        verify_totals()
+    call_command('rebuild_shopping_cart_totals', stdout=StringIO())
+    verify_totals()
+    assert ShoppingCartTotal.objects.filter(user=user).exists()
+
+
+def test_concurrent_new_ingredient_is_summed(user):
+    # Другой запрос успел вставить ту же новую строку итогов.
+    ingredient = Ingredient.objects.exclude(
+        shopping_cart_totals__user=user).first()
+    inserted = []
+
+    def concurrent_insert(execute, sql, params, many, context):
+        if (not inserted and sql.startswith('INSERT')
+                and 'recipes_shoppingcarttotal' in sql):
+            inserted.append(sql)
+            ShoppingCartTotal.objects.create(
+                user=user, ingredient=ingredient, amount=5)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(concurrent_insert):
+        ShoppingCartTotal.objects.apply((user.id,), {ingredient.id: 3})
+    assert ShoppingCartTotal.objects.get(
+        user=user, ingredient=ingredient).amount == 8
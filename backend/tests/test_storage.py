@@ -0,0 +1,110 @@
+import os
+import time
+from io import StringIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from rest_framework import status
+
+from recipes.images import render_renditions
+from recipes.models import Recipe
+from recipes.storage import ContentAddressedStorage
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def storage(settings):
+    return ContentAddressedStorage()
+
+
+def files(path):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), path)
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+def test_same_bytes_are_stored_once(storage, settings):
+    first = storage.save('recipes/images/a.PNG', ContentFile(b'picture'))
+    second = storage.save('recipes/images/b.png', ContentFile(b'picture'))
+    other = storage.save('recipes/images/c.png', ContentFile(b'another'))
+    assert first == second != other
+    assert first.startswith('recipes/images/') and first.endswith('.png')
+    assert files(settings.MEDIA_ROOT) == sorted((first, other))
+
+
+def recipe_payload(image, name):
+    return {
+        'name': name,
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': image,
+        'tags': [1],
+        'ingredients': [{'id': 1, 'amount': 10}],
+    }
+
+
+def test_recipes_share_uploaded_image(admin_client, image):
+    ids = [
+        admin_client.post('/api/recipes/', recipe_payload(image, name)).data[
+            'id']
+        for name in ('Первый', 'Второй')
+    ]
+    first, second = Recipe.objects.filter(id__in=ids)
+    assert first.image.name == second.image.name
+    assert Recipe.objects.image_references()[first.image.name] == 2
+
+
+def age(name, hours=48):
+    path = default_storage.path(name)
+    past = time.time() - hours * 3600
+    os.utime(path, (past, past))
+
+
+def test_garbage_collection_keeps_referenced_files(admin_client, image,
+                                                   settings):
+    response = admin_client.post(
+        '/api/recipes/', recipe_payload(image, 'Рецепт'))
+    assert response.status_code == status.HTTP_201_CREATED
+    recipe = Recipe.objects.get(id=response.data['id'])
+    render_renditions(recipe)
+    kept = files(settings.MEDIA_ROOT)
+    storage = recipe.image.storage
+    orphan = storage.save('recipes/images/x.png', ContentFile(b'orphan'))
+    fresh = storage.save('recipes/images/y.png', ContentFile(b'fresh'))
+    for name in kept + [orphan]:
+        age(name)
+    call_command('collect_media_garbage', '--dry-run', stdout=StringIO())
+    assert orphan in files(settings.MEDIA_ROOT)
+    call_command('collect_media_garbage', stdout=StringIO())
+    assert files(settings.MEDIA_ROOT) == sorted(kept + [fresh])
+    recipe.delete()
+    call_command('collect_media_garbage', stdout=StringIO())
+    assert files(settings.MEDIA_ROOT) == [fresh]
+
+
+def test_repeated_upload_refreshes_old_file(storage, settings):
+    name = storage.save('recipes/images/a.png', ContentFile(b'picture'))
+    age(name)
+    storage.save('recipes/images/b.png', ContentFile(b'picture'))
+    call_command('collect_media_garbage', stdout=StringIO())
+    assert name in files(settings.MEDIA_ROOT)
+
+
+def test_garbage_collection_rechecks_references(admin_client, image,
+                                                settings, monkeypatch):
+    # Рецепт сохранён уже после того, как сборщик собрал ссылки.
+    response = admin_client.post(
+        '/api/recipes/', recipe_payload(image, 'Рецепт'))
+    recipe = Recipe.objects.get(id=response.data['id'])
+    render_renditions(recipe)
+    kept = files(settings.MEDIA_ROOT)
+    for name in kept:
+        age(name)
+    monkeypatch.setattr(
+        Recipe.objects, 'image_references', lambda: {}, raising=False)
+    call_command('collect_media_garbage', stdout=StringIO())
+    assert files(settings.MEDIA_ROOT) == kept
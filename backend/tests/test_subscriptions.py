@@ -0,0 +1,62 @@
+import pytest
+from rest_framework import status
+
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/users/subscriptions/'
+
+
+def test_subscriptions_lists_followed_authors(user_client, user):
+    response = user_client.get(URL, {'limit': 100})
+    assert response.status_code == status.HTTP_200_OK
+    authors = set(user.subscribers.values_list('author_id', flat=True))
+    assert response.data['count'] == len(authors)
+    assert {item['id'] for item in response.data['results']} == authors
+    for item in response.data['results']:
+        assert item['is_subscribed'] is True
+        assert item['recipes_count'] == Recipe.objects.filter(
+            author_id=item['id']).count()
+        assert len(item['recipes']) == item['recipes_count']
+
+
+def test_recipes_limit_keeps_latest_recipes(user_client):
+    response = user_client.get(URL, {'limit': 100, 'recipes_limit': 2})
+    for item in response.data['results']:
+        latest = list(Recipe.objects.filter(
+            author_id=item['id']).order_by('-pub_date', '-id').values_list(
+            'id', flat=True)[:2])
+        assert [recipe['id'] for recipe in item['recipes']] == latest
+
+
+@pytest.mark.parametrize('value', ('0', '-1', 'abc'))
+def test_invalid_recipes_limit(user_client, value):
+    response = user_client.get(URL, {'recipes_limit': value})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_subscriptions_require_auth(anon_client):
+    response = anon_client.get(URL)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_subscribe_errors(user_client, user):
+    author_id = user.subscribers.values_list('author_id', flat=True).first()
+    response = user_client.post(f'/api/users/{user.id}/subscribe/')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = user_client.post(f'/api/users/{author_id}/subscribe/')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    user_client.delete(f'/api/users/{author_id}/subscribe/')
+    response = user_client.delete(f'/api/users/{author_id}/subscribe/')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_subscribe_returns_author_with_limited_recipes(user_client, user):
+    author_id = user.subscribers.values_list('author_id', flat=True).first()
+    user_client.delete(f'/api/users/{author_id}/subscribe/')
+    response = user_client.post(
+        f'/api/users/{author_id}/subscribe/?recipes_limit=1')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['is_subscribed'] is True
+    assert len(response.data['recipes']) == 1
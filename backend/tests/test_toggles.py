@@ -0,0 +1,124 @@
+"""Переключатели избранного и подписок под одновременными запросами.
+
+Клиенты работают в отдельных потоках со своими соединениями с БД, как
+параллельные запросы к серверу. Тестовая SQLite в памяти не допускает
+одновременной записи из разных соединений, поэтому каждый SQL-запрос
+потока выполняется под общей блокировкой, а запрос к таблице, занятой
+чужой транзакцией, повторяется, как ожидание блокировки в PostgreSQL.
+Запросы разных клиентов по-прежнему чередуются, и прежняя пара
+exists() + create() в такой схеме получала IntegrityError. Всё, что
+потоки записали, они же и удаляют.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import OperationalError, connection
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Recipe
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+CLIENTS = 8
+ROUNDS = 5
+LOCK_TIMEOUT = 10
+STATEMENT_LOCK = threading.Lock()
+
+
+def serialized(execute, sql, params, many, context):
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        with STATEMENT_LOCK:
+            try:
+                return execute(sql, params, many, context)
+            except OperationalError as error:
+                if ('locked' not in str(error)
+                        or time.monotonic() > deadline):
+                    raise
+        time.sleep(0.001)
+
+
+def in_thread(func, *args):
+    """Выполняет func в отдельном потоке с собственным соединением."""
+    def target():
+        try:
+            with connection.execute_wrapper(serialized):
+                return func(*args)
+        finally:
+            connection.close()
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(target).result()
+
+
+def hammer(user_id, method, url):
+    """CLIENTS клиентов одновременно отправляют один и тот же запрос."""
+    key = in_thread(
+        lambda: Token.objects.values_list('key', flat=True).get(
+            user_id=user_id))
+    barrier = threading.Barrier(CLIENTS)
+
+    def request():
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        barrier.wait()
+        try:
+            with connection.execute_wrapper(serialized):
+                return getattr(client, method)(url).status_code
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        return sorted(pool.map(lambda _: request(), range(CLIENTS)))
+
+
+@pytest.mark.parametrize('route, model, field, target', (
+    ('recipes/{}/favorite', Favorite, 'recipe_id', Recipe),
+    ('users/{}/subscribe', Subscription, 'author_id', None),
+))
+def test_concurrent_toggles(route, model, field, target):
+    user_id = 2
+
+    def free_target():
+        taken = model.objects.filter(user_id=user_id).values_list(
+            field, flat=True)
+        if target is None:
+            return Token.objects.exclude(
+                user_id__in=[user_id, *taken]
+            ).values_list('user_id', flat=True).first()
+        return target.objects.exclude(id__in=taken).values_list(
+            'id', flat=True).first()
+
+    target_id = in_thread(free_target)
+    url = f'/api/{route.format(target_id)}/'
+    pair = {'user_id': user_id, field: target_id}
+    try:
+        for _ in range(ROUNDS):
+            added = hammer(user_id, 'post', url)
+            assert added == [status.HTTP_201_CREATED] + [
+                status.HTTP_400_BAD_REQUEST] * (CLIENTS - 1)
+            assert in_thread(lambda: model.objects.filter(**pair).count()) == 1
+            removed = hammer(user_id, 'delete', url)
+            assert removed == [status.HTTP_204_NO_CONTENT] + [
+                status.HTTP_400_BAD_REQUEST] * (CLIENTS - 1)
+            assert not in_thread(lambda: model.objects.filter(**pair).exists())
+    finally:
+        in_thread(lambda: model.objects.filter(**pair).delete())
+
+
+def test_toggle_statements(user, user_client, tokens,
+                           django_assert_num_queries):
+    recipe = Recipe.objects.exclude(favorites__user=user).first()
+    url = f'/api/recipes/{recipe.id}/favorite/'
+    # Рецепт для ответа, INSERT ... ON CONFLICT DO NOTHING, UPDATE
+    # счётчика и upsert рейтинга; пользователь по токену — из кеша.
+    with django_assert_num_queries(4):
+        assert user_client.post(url).status_code == status.HTTP_201_CREATED
+    # DELETE ... RETURNING, UPDATE счётчика и upsert рейтинга.
+    with django_assert_num_queries(3):
+        response = user_client.delete(url)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
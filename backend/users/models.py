@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import F
 
 from .validators import validate_username
 
@@ -30,6 +31,16 @@ class User(AbstractUser):
         verbose_name='Пароль',
         max_length=50,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name', 'password')
@@ -49,6 +60,114 @@ class User(AbstractUser):
         return self.username
 
 
+def change_counter(model, pk, field, delta):
+    """Сдвигает счётчик строки одним UPDATE ... SET field = field + delta.
+
+    Сложение выполняет база, поэтому одновременные изменения не теряются.
+    """
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+class UniquePairQuerySet(models.QuerySet):
+    """Запись и удаление строк связи «пользователь — объект» одним запросом.
+
+    После вставки или удаления строки в той же транзакции вызывается
+    pair_changed. По умолчанию он сдвигает счётчик связанного объекта,
+    если у модели задан pair_counter = (поле связи, поле счётчика).
+    """
+
+    def create_if_missing(self, **values):
+        """INSERT ... ON CONFLICT DO NOTHING.
+
+        Возвращает True, если строка добавлена, и False, если такая пара
+        уже есть. Одновременные запросы не получают IntegrityError и не
+        ждут друг друга. Синтаксис поддерживают PostgreSQL и SQLite 3.24+.
+        """
+        obj = self.model(**values)
+        with transaction.atomic(using=self.db, savepoint=False):
+            created = self._insert_ignore(obj)
+            if created:
+                self.pair_changed(obj, 1)
+        return created
+
+    def delete_if_present(self, **values):
+        """DELETE ... RETURNING; True, если строка была.
+
+        Удалённая строка возвращается тем же запросом и передаётся в
+        pair_changed. RETURNING поддерживают PostgreSQL и SQLite 3.35+.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            obj = self._delete_returning(values)
+            if obj is not None:
+                self.pair_changed(obj, -1)
+        return obj is not None
+
+    def pair_changed(self, obj, delta):
+        counter = getattr(self.model, 'pair_counter', None)
+        if counter is None:
+            return
+        name, field = counter
+        relation = self.model._meta.get_field(name)
+        change_counter(
+            relation.related_model,
+            getattr(obj, relation.attname),
+            field,
+            delta,
+        )
+
+    def _insert_ignore(self, obj):
+        connection = connections[self.db]
+        opts = self.model._meta
+        fields = [
+            field for field in opts.concrete_fields
+            if not isinstance(field, models.AutoField)
+        ]
+        quote = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING'.format(
+            quote(opts.db_table),
+            ', '.join(quote(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        params = [
+            field.get_db_prep_save(field.pre_save(obj, True), connection)
+            for field in fields
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount == 1
+
+    def _delete_returning(self, values):
+        connection = connections[self.db]
+        opts = self.model._meta
+        quote = connection.ops.quote_name
+        lookups = [opts.get_field(name) for name in values]
+        fields = opts.concrete_fields
+        sql = 'DELETE FROM {} WHERE {} RETURNING {}'.format(
+            quote(opts.db_table),
+            ' AND '.join(f'{quote(field.column)} = %s' for field in lookups),
+            ', '.join(quote(field.column) for field in fields),
+        )
+        params = [
+            field.get_db_prep_value(getattr(value, 'pk', value), connection)
+            for field, value in zip(lookups, values.values())
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        converted = []
+        for field, value in zip(fields, row):
+            column = field.get_col(opts.db_table)
+            for converter in (
+                    connection.ops.get_db_converters(column)
+                    + field.get_db_converters(connection)):
+                value = converter(value, column, connection)
+            converted.append(value)
+        return self.model.from_db(
+            self.db, [field.attname for field in fields], converted)
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(
         User,
@@ -63,6 +182,9 @@ class Subscription(models.Model):
         related_name='subscribed_authors',
     )
 
+    objects = UniquePairQuerySet.as_manager()
+    pair_counter = ('author', 'followers_count')
+
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Подписка'